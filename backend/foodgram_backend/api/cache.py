@@ -0,0 +1,55 @@
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+INGREDIENTS_VERSION_KEY = 'version:ingredients'
+TAGS_VERSION_KEY = 'version:tags'
+
+
+def shopping_cart_version_key(user_id):
+    return f'version:shopping_cart:{user_id}'
+
+
+def table_version_key(table_name):
+    return f'version:table:{table_name}'
+
+
+def recipe_version_key(recipe_id):
+    return f'version:recipe:{recipe_id}'
+
+
+def get_version(key):
+    """
+    Текущая версия набора данных.
+    Версия - это время последнего изменения в наносекундах, поэтому
+    после вытеснения ключа из кэша она не повторяет старые значения.
+    """
+    return cache.get_or_set(key, time.time_ns, timeout=None)
+
+
+def get_versions(*keys):
+    """Версии нескольких наборов данных за одно обращение к кэшу."""
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*keys):
+    """
+    Помечает наборы данных изменёнными.
+    Внутри транзакции версия меняется ещё раз после коммита, иначе
+    кэш мог бы успеть сохраниться под новой версией со старыми данными.
+    """
+    if not keys:
+        return
+    _set_versions(keys)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _set_versions(keys))
+
+
+def _set_versions(keys):
+    cache.set_many(dict.fromkeys(keys, time.time_ns()), timeout=None)
@@ -0,0 +1,19 @@
+from rest_framework import serializers
+
+from apps.foodgram.thumbnails import get_thumbnail_url
+
+
+class ThumbnailField(serializers.ReadOnlyField):
+    """Абсолютный адрес WebP-копии изображения рецепта размера size."""
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        url = get_thumbnail_url(value, self.size)
+        request = self.context.get('request')
+        if url is not None and request is not None:
+            return request.build_absolute_uri(url)
+        return url
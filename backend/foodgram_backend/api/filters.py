@@ -1,7 +1,15 @@
 # pylint: disable=E1101
+from functools import reduce
+from operator import and_
+
 import django_filters as filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.filters import SearchFilter
 
 from apps.foodgram.models import Recipe
+from apps.foodgram.search import SEARCH_CONFIG
 from apps.ingredients.models import Ingredient
 from apps.tags.models import Tag
 
@@ -40,6 +48,35 @@ class RecipeFilter(filters.FilterSet):
         return queryset.exclude(shopping_recipe__user=self.request.user)
 
 
+class RecipeSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск рецептов по ?search=: название, описание
+    и ингредиенты. В Postgres - по search_vector с GIN-индексом
+    и сортировкой по релевантности, в других СУБД - через icontains
+    (в SQLite он не учитывает регистр только для латиницы).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(
+                ' '.join(terms), config=SEARCH_CONFIG, search_type='websearch'
+            )
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date', '-id')
+        return queryset.filter(
+            reduce(and_, (
+                Q(name__icontains=term)
+                | Q(text__icontains=term)
+                | Q(ingredients__name__icontains=term)
+                for term in terms
+            ))
+        ).distinct()
+
+
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(lookup_expr='startswith')
 
@@ -1,13 +1,17 @@
 # pylint: disable=E1101
 
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from apps.foodgram.models import Recipe, RecipeIngredient
+from apps.foodgram.models import ImageUpload, Recipe, RecipeIngredient
+from apps.foodgram.search import update_search_vector
 from apps.ingredients.models import Ingredient
 from apps.tags.models import Tag
 
+from api.fields import ThumbnailField
+from api.foodgram.shopping_cart import bump_recipe_shopping_carts
 from api.users.users_serializers import CustomUserSerializer
 from api.tags.tags_serializers import TagSerializer
 
@@ -49,19 +53,40 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True,
         default=False
     )
+    image_card = ThumbnailField('card')
+    image_detail = ThumbnailField('detail')
+    image_retina = ThumbnailField('retina')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time',)
+                  'name', 'image', 'image_card', 'image_detail',
+                  'image_retina', 'text', 'cooking_time',)
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        """
+        Ингредиенты рецепта.
+        Берутся из prefetch_related, если queryset их подгрузил.
+        """
+        ingredients = obj.recipe_ingredient.select_related('ingredient')
+        if 'recipe_ingredient' in getattr(
+                obj, '_prefetched_objects_cache', {}):
+            ingredients = obj.recipe_ingredient.all()
         serializer = RecipeIngredientsSerializer(ingredients, many=True)
         return serializer.data
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_MAX_SIZE,
+        label='Рецепты',
+        help_text='Список id рецептов'
+    )
+
+
 class MiniRecipeIngredientSerialiser(serializers.ModelSerializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField()
@@ -91,6 +116,14 @@ class CreateUpdateDeleteRecipeSerializer(serializers.ModelSerializer):
         label='Изображение',
         help_text='Добавьте изображение (необязательно)'
     )
+    image_token = serializers.UUIDField(
+        required=False,
+        write_only=True,
+        label='Токен изображения',
+        help_text=(
+            'Токен изображения, загруженного через /api/recipes/images/'
+            ' (вместо image)')
+    )
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
@@ -116,7 +149,7 @@ class CreateUpdateDeleteRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'author', 'ingredients',
-                  'tags', 'image', 'name',
+                  'tags', 'image', 'image_token', 'name',
                   'text', 'cooking_time')
         extra_kwargs = {
             'name': {'required': True},
@@ -140,6 +173,15 @@ class CreateUpdateDeleteRecipeSerializer(serializers.ModelSerializer):
                     'error': 'Ингредиенты в рецепте должны быть уникальными.'
                 }
             )
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                {
+                    'error': 'Ингредиенты не найдены: {}.'.format(
+                        ', '.join(map(str, missing)))
+                }
+            )
         return value
 
     def validate_tags(self, value):
@@ -169,26 +211,113 @@ class CreateUpdateDeleteRecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
+    def validate_image_token(self, value):
+        upload = ImageUpload.objects.filter(
+            token=value, user=self.context['request'].user).first()
+        if upload is None:
+            raise serializers.ValidationError(
+                {
+                    'error': 'Загруженное изображение не найдено.'
+                }
+            )
+        return upload
+
+    def validate(self, data):
+        if 'image' in data and 'image_token' in data:
+            raise serializers.ValidationError(
+                {
+                    'error': 'Укажите либо image, либо image_token.'
+                }
+            )
+        return data
+
+    def take_image_upload(self, validated_data):
+        """
+        Подставляет файл загруженного изображения вместо image.
+        Файл уже лежит в каталоге рецептов и не копируется, запись
+        о загрузке удаляется, поэтому токен используется один раз.
+        """
+        upload = validated_data.pop('image_token', None)
+        if upload is None:
+            return
+        deleted, _ = ImageUpload.objects.filter(pk=upload.pk).delete()
+        if not deleted:
+            raise serializers.ValidationError(
+                {
+                    'error': 'Загруженное изображение уже использовано.'
+                }
+            )
+        validated_data['image'] = upload.image.name
+
+    def create_ingredients(self, recipe, ingredients):
+        """
+        Все ингредиенты рецепта одним INSERT.
+        Существование ингредиентов уже проверено в validate_ingredients.
+        """
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к присланному набору, трогая
+        только изменившиеся строки: лишние удаляются, новые добавляются,
+        у оставшихся обновляется количество. Первичные ключи
+        неизменённых строк сохраняются.
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredient.all()
+        }
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = [
+            item.pk for ingredient_id, item in existing.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in existing
+        ]
+
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.create_ingredients(recipe, added)
+        if changed or added:
+            bump_recipe_shopping_carts(recipe.id)
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        self.take_image_upload(validated_data)
 
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
-
-        for ingredient in ingredients:
-            amount = ingredient['amount']
-            ingredient = get_object_or_404(Ingredient, pk=ingredient['id'])
-
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=amount
-            )
+        self.create_ingredients(recipe, ingredients)
+        # bulk_create не отправляет post_save ингредиентов рецепта.
+        update_search_vector([recipe.id])
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         if tags is not None:
@@ -196,26 +325,21 @@ class CreateUpdateDeleteRecipeSerializer(serializers.ModelSerializer):
 
         ingredients = validated_data.pop('ingredients', None)
         if ingredients is not None:
-            instance.ingredients.clear()
-
-            for ingredient in ingredients:
-                amount = ingredient['amount']
-                ingredient = get_object_or_404(Ingredient, pk=ingredient['id'])
-
-                RecipeIngredient.objects.update_or_create(
-                    recipe=instance,
-                    ingredient=ingredient,
-                    defaults={'amount': amount}
-                )
+            self.update_ingredients(instance, ingredients)
 
+        self.take_image_upload(validated_data)
         return super().update(instance, validated_data)
 
     def destroy(self, instance):
         instance.delete()
 
     def to_representation(self, instance):
-        serializer = RecipeSerializer(
-            instance,
-            context={'request': self.context.get('request')}
-        )
-        return serializer.data
+        """
+        Ответ на создание и изменение собирается так же, как карточка
+        рецепта, вместе с отметками избранного и списка покупок.
+        """
+        # recipe_fragments сам импортирует RecipeSerializer отсюда.
+        from api.foodgram.recipe_fragments import render_recipes
+        return render_recipes(
+            [instance.pk], self.context['request'], {instance.pk: instance}
+        )[0]
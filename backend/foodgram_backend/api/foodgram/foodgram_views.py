@@ -1,57 +1,170 @@
 # pylint: disable=E1101
-from django.db.models import Exists, OuterRef
-from django.http import HttpResponse
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from weasyprint import HTML
-
 from api.users.users_serializers import RecipeMinifiedSerializer
 
-from api.filters import RecipeFilter
+from api.filters import RecipeFilter, RecipeSearchFilter
 from api.foodgram.foodgram_serializers import (
-    CreateUpdateDeleteRecipeSerializer, RecipeSerializer)
-from api.pagination import MyPagination
+    CreateUpdateDeleteRecipeSerializer, RecipeIdsSerializer, RecipeSerializer)
+from api.foodgram.image_uploads import ImageUploadHandler, validate_image
+from api.foodgram.recipe_fragments import (recipe_page_cache_key,
+                                           render_recipes)
+from api.foodgram.recipe_relations import add_recipes, remove_recipes
+from api.foodgram.shopping_cart import (get_shopping_list_pdf,
+                                        iter_shopping_list_csv,
+                                        iter_shopping_list_txt)
+from api.pagination import FeedPagination, RecipePagination
 from api.permissions import AuthorOrReadOnly
+from api.renderers import (CSVRenderer, FileContentNegotiation, FileRenderer,
+                           PDFRenderer, PlainTextRenderer)
 
-from apps.foodgram.models import Favorite, Recipe, ShoppingCart
+from apps.foodgram.models import (Favorite, FeedEntry, ImageUpload, Recipe,
+                                  ShoppingCart)
+from apps.foodgram.relations import add_relation, remove_relation
+from apps.users.models import Follow
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (AuthorOrReadOnly, )
     filter_backends = (DjangoFilterBackend,
-                       filters.SearchFilter,)
-    pagination_class = MyPagination
+                       RecipeSearchFilter,)
+    pagination_class = RecipePagination
     filterset_class = RecipeFilter
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve',):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeSerializer
         return CreateUpdateDeleteRecipeSerializer
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
+        return Recipe.objects.select_related('author').defer('search_vector')
 
-        if self.request.user.is_authenticated:
-            favorite = Favorite.objects.filter(
-                user=self.request.user,
-                recipe=OuterRef('pk')
-            )
-            shopping_cart = ShoppingCart.objects.filter(
-                user=self.request.user,
-                recipe=OuterRef('pk')
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Ошибки действий, отдающих файлы, всё равно отдаются в JSON."""
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if (
+            isinstance(response, Response)
+            and response.status_code >= status.HTTP_400_BAD_REQUEST
+            and isinstance(
+                getattr(response, 'accepted_renderer', None), FileRenderer)
+        ):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Страница рецептов общая для всех пользователей: id рецептов
+        страницы и ссылки пагинации кэшируются по адресу запроса и
+        версиям таблиц. Представления рецептов берутся из кэша
+        фрагментов, отметки пользователя подставляются поверх.
+        """
+        key = recipe_page_cache_key(request)
+        data = cache.get(key)
+        recipes = None
+        if data is None:
+            page = self.paginate_queryset(
+                self.filter_queryset(self.get_queryset()))
+            data = self.get_paginated_response(
+                [recipe.pk for recipe in page]).data
+            cache.set(key, data, settings.RECIPE_PAGE_CACHE_TIMEOUT)
+            recipes = {recipe.pk: recipe for recipe in page}
+        data = OrderedDict(data)
+        data['results'] = render_recipes(data['results'], request, recipes)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        return Response(
+            render_recipes([recipe.pk], request, {recipe.pk: recipe})[0])
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='feed',
+        url_name='feed',
+    )
+    def feed(self, request):
+        """
+        Рецепты авторов, на которых подписан пользователь, от новых
+        к старым, с курсорной пагинацией.
+        """
+        paginator = FeedPagination()
+        direct_authors = list(
+            Follow.objects.filter(
+                user=request.user,
+                author__followers_count__gt=(
+                    settings.FEED_FAN_OUT_MAX_FOLLOWERS)
+            ).values_list('author_id', flat=True)
+        )
+        keys = paginator.paginate_feed(
+            FeedEntry.objects.filter(user=request.user),
+            Recipe.objects.filter(
+                author_id__in=direct_authors) if direct_authors else None,
+            request
+        )
+        return paginator.get_paginated_response(
+            render_recipes([recipe_id for _, recipe_id in keys], request))
+
+    @action(
+        methods=['post'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        parser_classes=[MultiPartParser],
+        url_path='images',
+        url_name='images',
+    )
+    def upload_image(self, request):
+        """
+        Загрузка изображения рецепта файлом в поле image
+        multipart/form-data. Тело принимается потоком на диск,
+        в ответе token для поля image_token при создании
+        или изменении рецепта.
+        """
+        handler = ImageUploadHandler()
+        request.upload_handlers = [handler]
+        image = request.FILES.get('image')
+        if handler.error is not None:
+            error, status_code = handler.error
+            return Response({'error': error}, status=status_code)
+        if image is None:
+            return Response(
+                {'error': 'Добавьте изображение в поле image.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            queryset = queryset.annotate(
-                is_favorited=Exists(favorite),
-                is_in_shopping_cart=Exists(shopping_cart)
+        error = validate_image(image.temporary_file_path())
+        if error is not None:
+            image.close()
+            return Response(
+                {'error': error},
+                status=status.HTTP_400_BAD_REQUEST
             )
-
-        return queryset
+        upload = ImageUpload(user=request.user)
+        image.name = f'{upload.token.hex}.{handler.extension}'
+        upload.image = image
+        upload.save()
+        return Response(
+            {
+                'token': upload.token,
+                'image': request.build_absolute_uri(upload.image.url),
+            },
+            status=status.HTTP_201_CREATED
+        )
 
     @action(
         methods=['get'],
@@ -59,58 +172,93 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
+        renderer_classes=[PDFRenderer, PlainTextRenderer, CSVRenderer,
+                          JSONRenderer],
+        content_negotiation_class=FileContentNegotiation,
     )
     def download_shopping_cart(self, request):
+        """
+        Список покупок в PDF (по умолчанию), TXT или CSV.
+        Формат задаётся параметром ?format= или заголовком Accept,
+        при ?format=json, как и раньше, отдаётся PDF.
+        Текстовые форматы отдаются потоком прямо из результата запроса.
+        """
         if request.user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
-        shopping_cart_items = ShoppingCart.objects.filter(user=request.user)
-        recipe_instances = [item.recipe for item in shopping_cart_items]
-        serializer = RecipeSerializer(
-            recipe_instances, many=True, context={'request': request})
-        ingredients_dict = {}
-        for recipe in serializer.data:
-            for ingredient in recipe['ingredients']:
-                name = ingredient['name']
-                measurement_unit = ingredient['measurement_unit']
-                amount = ingredient['amount']
-                key = f"{name} ({measurement_unit})"
-                if key in ingredients_dict:
-                    ingredients_dict[key] += amount
-                else:
-                    ingredients_dict[key] = amount
-        html_string = (
-            f"Список покупок пользователя {request.user.username}: \n")
-        for key, value in ingredients_dict.items():
-            html_string += f"{key} - {value}\n"
-        html = HTML(string=html_string)
-        result = html.write_pdf()
+        renderer = request.accepted_renderer
+        if renderer.format in (PlainTextRenderer.format, CSVRenderer.format):
+            iter_shopping_list = (
+                iter_shopping_list_csv
+                if renderer.format == CSVRenderer.format
+                else iter_shopping_list_txt
+            )
+            response = StreamingHttpResponse(
+                iter_shopping_list(request.user),
+                content_type=f'{renderer.media_type}; charset=utf-8'
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="shopping_cart.{renderer.format}"')
+            return response
+        result, cached = get_shopping_list_pdf(request.user)
         response = HttpResponse(content_type='application/pdf')
         response['Content-Disposition'] = (
             'attachment; filename="shopping_cart.pdf"')
+        response['X-Cache'] = 'HIT' if cached else 'MISS'
         response.write(result)
         return response
 
+    def change_recipes_in_bulk(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = (
+            add_recipes if request.method == 'POST' else remove_recipes)
+        results = change(
+            model, request.user, serializer.validated_data['recipes'])
+        return Response(
+            {
+                'results': [
+                    {'id': recipe_id, 'status': result}
+                    for recipe_id, result in results.items()
+                ]
+            }
+        )
+
     @action(
-        methods=['post'],
-        detail=True,
+        methods=['post', 'delete'],
+        detail=False,
         permission_classes=[IsAuthenticated],
         url_path='shopping_cart',
-        url_name='shopping_cart',
+        url_name='bulk_shopping_cart',
     )
-    def add_to_shopping_cart(self, request, pk=None):
-        if request.user.is_anonymous:
-            return Response(status=status.HTTP_401_UNAUTHORIZED)
+    def bulk_shopping_cart(self, request):
+        """
+        Добавление и удаление пачки рецептов в списке покупок:
+        {"recipes": [1, 2, 3]}. Результат отдаётся по каждому id.
+        """
+        return self.change_recipes_in_bulk(request, ShoppingCart)
 
-        recipe = get_object_or_404(Recipe, pk=pk)
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='bulk_favorite',
+    )
+    def bulk_favorite(self, request):
+        """То же для избранного."""
+        return self.change_recipes_in_bulk(request, Favorite)
 
-        if ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe).exists():
+    def add_recipe(self, request, pk, model, error):
+        """
+        Добавление рецепта в избранное или список покупок: запрос
+        рецепта для ответа и один INSERT ... ON CONFLICT DO NOTHING.
+        """
+        recipe = get_object_or_404(Recipe, pk=pk)
+        if not add_relation(model, user=request.user, recipe=recipe):
             return Response(
-                {'error': 'Рецепт уже есть в списке покупок.'},
+                {'error': error},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        ShoppingCart.objects.create(user=request.user, recipe=recipe)
         serializer = RecipeMinifiedSerializer(
             recipe,
             context={
@@ -120,31 +268,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @add_to_shopping_cart.mapping.delete
-    def remove_from_shopping_cart(self, request, pk=None):
-        if request.user.is_anonymous:
-            return Response(status=status.HTTP_401_UNAUTHORIZED)
-
-        recipe = get_object_or_404(Recipe, pk=pk)
-
-        if not ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe).exists():
+    def remove_recipe(self, request, pk, model, error, message):
+        """
+        Удаление одним DELETE. Рецепт запрашивается, только если
+        удалять было нечего, чтобы отличить 404 от 400.
+        """
+        if not remove_relation(model, user=request.user, recipe_id=pk):
+            get_object_or_404(Recipe, pk=pk)
             return Response(
-                {'error': 'Рецепт уже удалён из списка покупок.'},
+                {'error': error},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        shopping_cart = get_object_or_404(
-            ShoppingCart,
-            user=request.user,
-            recipe=recipe
-        )
-        shopping_cart.delete()
         return Response(
-            {'message': 'Рецепт удалён из списка покупок.'},
+            {'message': message},
             status=status.HTTP_204_NO_CONTENT
         )
 
+    @action(
+        methods=['post'],
+        detail=True,
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping_cart',
+    )
+    def add_to_shopping_cart(self, request, pk=None):
+        return self.add_recipe(
+            request, pk, ShoppingCart, 'Рецепт уже есть в списке покупок.')
+
+    @add_to_shopping_cart.mapping.delete
+    def remove_from_shopping_cart(self, request, pk=None):
+        return self.remove_recipe(
+            request, pk, ShoppingCart,
+            'Рецепт уже удалён из списка покупок.',
+            'Рецепт удалён из списка покупок.'
+        )
+
     @action(
         methods=['post'],
         detail=True,
@@ -153,45 +311,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_name='favorite',
     )
     def add_to_favorite(self, request, pk=None):
-        if request.user.is_anonymous:
-            return Response(status=status.HTTP_401_UNAUTHORIZED)
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if Favorite.objects.filter(
-                user=request.user, recipe=recipe).exists():
-            return Response(
-                {'error': 'Рецепт уже есть в Избранном.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        else:
-            Favorite.objects.create(user=request.user, recipe=recipe)
-            serializer = RecipeMinifiedSerializer(
-                recipe,
-                context={
-                    'request': request,
-                    'recipe': recipe
-                }
-            )
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_recipe(
+            request, pk, Favorite, 'Рецепт уже есть в Избранном.')
 
     @add_to_favorite.mapping.delete
     def remove_from_favorite(self, request, pk=None):
-        if request.user.is_anonymous:
-            return Response(status=status.HTTP_401_UNAUTHORIZED)
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if not Favorite.objects.filter(
-                user=request.user, recipe=recipe).exists():
-            return Response(
-                {'error': 'Рецепт уже удалён из Избранного.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        else:
-            favorite = get_object_or_404(
-                Favorite,
-                user=request.user,
-                recipe=recipe
-            )
-            favorite .delete()
-            return Response(
-                {'message': 'Рецепт удалён из Избранного.'},
-                status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe(
+            request, pk, Favorite,
+            'Рецепт уже удалён из Избранного.',
+            'Рецепт удалён из Избранного.'
+        )
@@ -0,0 +1,107 @@
+from http import HTTPStatus
+
+import filetype
+from django.conf import settings
+from django.core.files.uploadhandler import (SkipFile, StopUpload,
+                                             TemporaryFileUploadHandler)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from PIL import Image
+
+IMAGE_FIELD = 'image'
+
+# Сколько байт начала файла нужно filetype, чтобы узнать формат.
+HEADER_SIZE = 261
+
+
+def get_too_large_error():
+    return (
+        'Размер изображения должен быть не больше {} МБ.'.format(
+            settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)),
+        HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    )
+
+
+def get_type_error():
+    return (
+        'Поддерживаются только изображения JPEG, PNG, WebP и GIF.',
+        HTTPStatus.BAD_REQUEST
+    )
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемое изображение во временный файл кусками по
+    IMAGE_UPLOAD_CHUNK_SIZE, так что в памяти воркера держится
+    не больше одного куска. Размер проверяется по Content-Length
+    до чтения тела и по мере приёма, формат - по заголовку запроса
+    и по первым байтам файла. При ошибке приём останавливается,
+    а причина остаётся в error: (сообщение, код ответа).
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = settings.IMAGE_UPLOAD_CHUNK_SIZE
+        self.max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        self.header = b''
+        self.extension = None
+        self.error = None
+
+    def stop(self, error):
+        self.error = error
+        raise StopUpload(connection_reset=False)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # Запас на границы и заголовки частей multipart.
+        if content_length > self.max_size + self.chunk_size:
+            self.error = get_too_large_error()
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return super().handle_raw_input(
+            input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        if field_name != IMAGE_FIELD:
+            raise SkipFile()
+        if content_type not in settings.IMAGE_UPLOAD_CONTENT_TYPES:
+            self.stop(get_type_error())
+        self.header = b''
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+
+    def check_header(self):
+        kind = filetype.guess(self.header)
+        if kind is None or kind.mime not in (
+                settings.IMAGE_UPLOAD_CONTENT_TYPES):
+            self.stop(get_type_error())
+        self.extension = kind.extension
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.stop(get_too_large_error())
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) == HEADER_SIZE:
+                self.check_header()
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if len(self.header) < HEADER_SIZE:
+            self.check_header()
+        return super().file_complete(file_size)
+
+
+def validate_image(path):
+    """
+    Проверяет сохранённый на диск файл через Pillow: сначала только
+    заголовок с размерами, без распаковки пикселей, затем целостность.
+    Возвращает текст ошибки или None.
+    """
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+                return 'Изображение слишком большое по числу пикселей.'
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        return 'Файл повреждён или не является изображением.'
+    return None
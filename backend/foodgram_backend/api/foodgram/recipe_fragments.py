@@ -0,0 +1,172 @@
+# pylint: disable=E1101
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (Exists, OuterRef, Prefetch,
+                              prefetch_related_objects)
+
+from api.cache import (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY,
+                       bump_versions, get_versions, recipe_version_key,
+                       table_version_key)
+from api.foodgram.foodgram_serializers import RecipeSerializer
+from apps.foodgram.models import (Favorite, Recipe, RecipeIngredient,
+                                  RecipeTags, ShoppingCart)
+from apps.ingredients.models import Ingredient
+from apps.tags.models import Tag
+from apps.users.models import Follow
+
+VIEWER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+IMAGE_FIELDS = ('image', 'image_card', 'image_detail', 'image_retina')
+PER_USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+PAGE_TABLES = tuple(
+    model._meta.db_table
+    for model in (Recipe, RecipeTags, RecipeIngredient, Tag, Ingredient)
+)
+PER_USER_TABLES = tuple(
+    model._meta.db_table for model in (Favorite, ShoppingCart))
+
+
+def recipe_fragment_key(recipe_id):
+    return f'fragment:recipe:{recipe_id}'
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """
+    Меняет версии рецептов, и закэшированные представления перестают
+    совпадать с ними. Фрагмент, собранный из данных, прочитанных до
+    изменения, сохраняется со старой версией и тоже не используется.
+    """
+    bump_versions(*[recipe_version_key(recipe_id) for recipe_id in recipe_ids])
+
+
+def get_viewer_flags(recipe_ids, user):
+    """
+    Отметки пользователя для рецептов страницы одним запросом
+    по первичному ключу: (в избранном, в списке покупок,
+    подписан на автора) для каждого id рецепта.
+    """
+    if user.is_anonymous:
+        return {}
+    return {
+        pk: flags
+        for pk, *flags in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author_id'))),
+        ).values_list(
+            'pk', 'is_favorited', 'is_in_shopping_cart', 'is_subscribed'
+        ).order_by()
+    }
+
+
+def render_recipes(recipe_ids, request, recipes=None):
+    """
+    Представления рецептов для списка, ленты и карточки рецепта.
+    Не зависящая от пользователя часть (автор, теги, ингредиенты)
+    берётся из кэша одним get_many вместе с версиями самих рецептов
+    и справочников тегов и ингредиентов. Недостающие фрагменты
+    сериализуются после подгрузки тегов и ингредиентов только для
+    этих рецептов; уже загруженные объекты рецептов можно передать
+    в recipes.
+    Поля is_favorited, is_in_shopping_cart, is_subscribed и
+    абсолютный адрес изображения подставляются для текущего запроса.
+    """
+    keys = [recipe_fragment_key(recipe_id) for recipe_id in recipe_ids]
+    version_keys = [
+        recipe_version_key(recipe_id) for recipe_id in recipe_ids]
+    catalog_keys = [TAGS_VERSION_KEY, INGREDIENTS_VERSION_KEY]
+    cached = cache.get_many([*keys, *version_keys, *catalog_keys])
+    missing_versions = [
+        key for key in [*version_keys, *catalog_keys] if key not in cached]
+    if missing_versions:
+        cached.update(
+            zip(missing_versions, get_versions(*missing_versions)))
+    catalog_versions = [cached[key] for key in catalog_keys]
+    versions = {
+        recipe_id: [*catalog_versions, cached[version_key]]
+        for recipe_id, version_key in zip(recipe_ids, version_keys)
+    }
+    fragments = {}
+    for recipe_id, key in zip(recipe_ids, keys):
+        fragment = cached.get(key)
+        if (fragment is not None
+                and fragment['versions'] == versions[recipe_id]):
+            fragments[recipe_id] = fragment['data']
+
+    missing_ids = [
+        recipe_id for recipe_id in recipe_ids if recipe_id not in fragments]
+    if missing_ids:
+        recipes = recipes or {}
+        missing = [
+            recipes[recipe_id] for recipe_id in missing_ids
+            if recipe_id in recipes
+        ]
+        if len(missing) < len(missing_ids):
+            missing = list(
+                Recipe.objects.select_related('author').defer(
+                    'search_vector').filter(pk__in=missing_ids))
+        prefetch_related_objects(
+            missing,
+            'tags',
+            Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+        data = RecipeSerializer(missing, many=True, context={}).data
+        for recipe, item in zip(missing, data):
+            item.update(dict.fromkeys(VIEWER_FIELDS, False))
+            fragments[recipe.pk] = item
+        cache.set_many(
+            {
+                recipe_fragment_key(recipe.pk): {
+                    'data': fragments[recipe.pk],
+                    'versions': versions[recipe.pk],
+                }
+                for recipe in missing
+            },
+            settings.RECIPE_FRAGMENT_TIMEOUT
+        )
+
+    flags = get_viewer_flags(recipe_ids, request.user)
+    results = []
+    for recipe_id in recipe_ids:
+        if recipe_id not in fragments:
+            continue
+        fragment = fragments[recipe_id]
+        is_favorited, is_in_shopping_cart, is_subscribed = flags.get(
+            recipe_id, (False, False, False))
+        item = dict(
+            fragment,
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+            author=dict(fragment['author'], is_subscribed=is_subscribed),
+        )
+        for field in IMAGE_FIELDS:
+            if item[field]:
+                item[field] = request.build_absolute_uri(item[field])
+        results.append(item)
+    return results
+
+
+def recipe_page_cache_key(request):
+    """
+    Ключ общей для всех пользователей страницы списка рецептов:
+    адрес запроса и версии таблиц, от которых зависит выборка.
+    Фильтры по избранному и списку покупок зависят от пользователя,
+    с ними в ключ входят его id и версии этих таблиц.
+    """
+    tables = list(PAGE_TABLES)
+    parts = [request.build_absolute_uri()]
+    if set(request.query_params) & set(PER_USER_FILTERS):
+        tables += PER_USER_TABLES
+        parts.append(request.user.pk)
+    parts += get_versions(*map(table_version_key, tables))
+    return 'page:recipes:' + hashlib.md5(
+        repr(parts).encode()).hexdigest()
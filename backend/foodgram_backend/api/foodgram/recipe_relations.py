@@ -0,0 +1,86 @@
+# pylint: disable=E1101
+from django.db import transaction
+
+from api.cache import (bump_versions, shopping_cart_version_key,
+                       table_version_key)
+from apps.foodgram.counters import change_counters_in_bulk
+from apps.foodgram.models import Recipe, ShoppingCart
+from apps.foodgram.relations import delete_rows, insert_rows
+
+ADDED = 'added'
+REMOVED = 'removed'
+ALREADY_ADDED = 'already_added'
+ALREADY_REMOVED = 'already_removed'
+NOT_FOUND = 'not_found'
+
+
+def bump_relation_versions(model, user):
+    """
+    Сбрасывает кэши, которые при обычной записи сбросили бы сигналы:
+    bulk_create и удаление одним DELETE их не вызывают.
+    """
+    keys = [table_version_key(model._meta.db_table)]
+    if model is ShoppingCart:
+        keys.append(shopping_cart_version_key(user.id))
+    bump_versions(*keys)
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """
+    Добавляет рецепты в избранное или список покупок одним
+    INSERT ... ON CONFLICT DO NOTHING RETURNING. Счётчики и результаты
+    считаются по строкам, которые вставил именно этот запрос, поэтому
+    одновременные добавления не учитываются дважды.
+    Возвращает {id рецепта: результат} в порядке recipe_ids.
+    """
+    found = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True))
+    added = set(insert_rows(
+        model,
+        [
+            {'user': user, 'recipe': recipe_id}
+            for recipe_id in dict.fromkeys(recipe_ids)
+            if recipe_id in found
+        ],
+        returning='recipe'
+    ))
+    if added:
+        change_counters_in_bulk(
+            [model(user=user, recipe_id=recipe_id) for recipe_id in added], 1)
+        bump_relation_versions(model, user)
+    return {
+        recipe_id: (
+            NOT_FOUND if recipe_id not in found
+            else ADDED if recipe_id in added
+            else ALREADY_ADDED
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """
+    Убирает рецепты из избранного или списка покупок одним
+    DELETE ... RETURNING, счётчики уменьшаются только по строкам,
+    которые удалил именно этот запрос.
+    Возвращает {id рецепта: результат} в порядке recipe_ids.
+    """
+    found = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True))
+    removed = set(delete_rows(
+        model, returning='recipe', user=user, recipe__in=found))
+    if removed:
+        change_counters_in_bulk(
+            [model(user=user, recipe_id=recipe_id) for recipe_id in removed],
+            -1)
+        bump_relation_versions(model, user)
+    return {
+        recipe_id: (
+            NOT_FOUND if recipe_id not in found
+            else REMOVED if recipe_id in removed
+            else ALREADY_REMOVED
+        )
+        for recipe_id in recipe_ids
+    }
@@ -0,0 +1,111 @@
+# pylint: disable=E1101
+import csv
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Sum
+
+from api.cache import (INGREDIENTS_VERSION_KEY, bump_versions, get_version,
+                       shopping_cart_version_key)
+from apps.foodgram.models import RecipeIngredient, ShoppingCart
+
+PDF_HITS_KEY = 'stats:hits'
+PDF_MISSES_KEY = 'stats:misses'
+
+
+def get_shopping_list(user):
+    """
+    Суммарное количество ингредиентов рецептов из списка покупок.
+    Считается одним запросом с группировкой по названию и единице
+    измерения ингредиента.
+    """
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_recipe__user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('name', 'measurement_unit')
+
+
+def bump_recipe_shopping_carts(recipe_id):
+    """Сбрасывает списки покупок всех, у кого рецепт в корзине."""
+    bump_versions(*(
+        shopping_cart_version_key(user_id)
+        for user_id in ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True)
+    ))
+
+
+class Echo:
+    """Буфер для csv.writer, который просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_shopping_list_txt(user):
+    yield f"Список покупок пользователя {user.username}: \n"
+    for item in get_shopping_list(user).iterator():
+        yield (
+            f"{item['name']} ({item['measurement_unit']}) - "
+            f"{item['total_amount']}\n"
+        )
+
+
+def iter_shopping_list_csv(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for item in get_shopping_list(user).iterator():
+        yield writer.writerow((
+            item['name'], item['measurement_unit'], item['total_amount']
+        ))
+
+
+def render_shopping_list_pdf(user):
+    # weasyprint импортируется только когда действительно нужен PDF:
+    # это самый тяжёлый модуль, а текстовым форматам он не нужен.
+    from weasyprint import HTML
+
+    html_string = ''.join(iter_shopping_list_txt(user))
+    return HTML(string=html_string).write_pdf()
+
+
+def get_shopping_list_pdf(user):
+    """
+    PDF со списком покупок из кэша.
+    Ключ содержит версию корзины пользователя и версию справочника
+    ингредиентов, поэтому после любых изменений PDF рендерится заново.
+    Возвращает пару (pdf, взят ли он из кэша).
+    """
+    pdf_cache = caches[settings.SHOPPING_CART_CACHE]
+    key = 'pdf:{}:{}:{}:{}'.format(
+        user.id,
+        user.username,
+        get_version(shopping_cart_version_key(user.id)),
+        get_version(INGREDIENTS_VERSION_KEY),
+    )
+    pdf = pdf_cache.get(key)
+    if pdf is not None:
+        _increment(pdf_cache, PDF_HITS_KEY)
+        return pdf, True
+    _increment(pdf_cache, PDF_MISSES_KEY)
+    pdf = render_shopping_list_pdf(user)
+    pdf_cache.set(key, pdf)
+    return pdf, False
+
+
+def get_shopping_list_cache_stats():
+    pdf_cache = caches[settings.SHOPPING_CART_CACHE]
+    stats = pdf_cache.get_many((PDF_HITS_KEY, PDF_MISSES_KEY))
+    return {
+        'hits': stats.get(PDF_HITS_KEY, 0),
+        'misses': stats.get(PDF_MISSES_KEY, 0),
+    }
+
+
+def _increment(pdf_cache, key):
+    if not pdf_cache.add(key, 1, timeout=None):
+        pdf_cache.incr(key)
@@ -0,0 +1,154 @@
+# pylint: disable=E1101
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from api.cache import INGREDIENTS_VERSION_KEY, get_version
+from apps.ingredients.models import Ingredient
+
+WORD_RE = re.compile(r'\w+')
+
+
+def get_trigrams(word):
+    """Триграммы слова так же, как в pg_trgm: с пробелами по краям."""
+    word = f'  {word.casefold()} '
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def get_similarity(first, second):
+    """Сходство слов по расстоянию Левенштейна, от 0 до 1."""
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second_char),
+            ))
+        previous = current
+    return 1 - previous[-1] / max(len(first), len(second))
+
+
+class IngredientIndex:
+    """
+    Справочник ингредиентов в памяти процесса для автодополнения.
+    Строится при первом обращении и перестраивается, когда меняется
+    версия справочника (её поднимают сигналы на запись Ingredient).
+    Поиск по префиксу - бинарный поиск по отсортированным названиям.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._items = []
+        self._keys = []
+        self._words = []
+        self._trigrams = {}
+        self._word_sizes = {}
+
+    def _build(self):
+        self._items = list(
+            Ingredient.objects.order_by(
+                'name', 'id'
+            ).values('id', 'name', 'measurement_unit')
+        )
+        self._keys = sorted(
+            (item['name'].casefold(), position)
+            for position, item in enumerate(self._items)
+        )
+        self._words = [
+            WORD_RE.findall(item['name'].casefold()) for item in self._items
+        ]
+        self._trigrams = defaultdict(list)
+        self._word_sizes = {}
+        for position, words in enumerate(self._words):
+            for word_number, word in enumerate(words):
+                trigrams = get_trigrams(word)
+                self._word_sizes[position, word_number] = len(trigrams)
+                for trigram in trigrams:
+                    self._trigrams[trigram].append((position, word_number))
+
+    def _refresh(self):
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build()
+                    self._version = version
+
+    def search(self, name='', terms=()):
+        """
+        Ингредиенты, чьё название начинается с name (с учётом регистра,
+        как фильтр name) и с каждого из terms (без учёта регистра, как
+        поиск ^name). Порядок тот же, что у queryset справочника.
+        """
+        self._refresh()
+        terms = [term.casefold() for term in terms]
+        if name:
+            terms.append(name.casefold())
+        if not terms:
+            return self._items
+
+        prefix = max(terms, key=len)
+        start = bisect.bisect_left(self._keys, (prefix,))
+        positions = []
+        for key, position in self._keys[start:]:
+            if not key.startswith(prefix):
+                break
+            if all(key.startswith(term) for term in terms):
+                positions.append(position)
+        items = (self._items[position] for position in sorted(positions))
+        if name:
+            return [item for item in items if item['name'].startswith(name)]
+        return list(items)
+
+    def fuzzy_search(self, name, limit, threshold):
+        """
+        Поиск с опечатками: сначала ингредиенты, начинающиеся с name,
+        затем похожие. Кандидаты - названия, у которых хотя бы одно слово
+        похоже на слово запроса по триграммам (similarity из pg_trgm не
+        меньше threshold), их берём из инвертированного индекса триграмм.
+        Кандидатов упорядочиваем по среднему сходству слов запроса
+        с ближайшими словами названия, при равенстве - короче выше.
+        """
+        results = self.search(terms=[name])[:limit]
+        found = {item['id'] for item in results}
+        query_words = WORD_RE.findall(name.casefold())
+        query = set()
+        for word in query_words:
+            query |= get_trigrams(word)
+        if len(results) >= limit or not query:
+            return results
+
+        shared = defaultdict(int)
+        for trigram in query:
+            for word in self._trigrams.get(trigram, ()):
+                shared[word] += 1
+        candidates = set()
+        for (position, word_number), count in shared.items():
+            if count / (len(query) + self._word_sizes[
+                    position, word_number] - count) >= threshold:
+                candidates.add(position)
+        scores = {
+            position: sum(
+                max(get_similarity(query_word, word)
+                    for word in self._words[position])
+                for query_word in query_words
+            ) / len(query_words)
+            for position in candidates
+        }
+        for position in sorted(scores, key=lambda position: (
+                -scores[position],
+                len(self._items[position]['name']),
+                position)):
+            item = self._items[position]
+            if item['id'] not in found:
+                results.append(item)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -1,16 +1,21 @@
 # pylint: disable=E1101
+from django.conf import settings
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import filters, viewsets
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 
 from apps.ingredients.models import Ingredient
 
+from api.cache import INGREDIENTS_VERSION_KEY
 from api.filters import IngredientFilter
+from api.ingredients.ingredients_index import ingredient_index
 from api.ingredients.ingredients_serializers import IngredientSerializer
+from api.mixins import CatalogCacheMixin
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny, ]
@@ -18,3 +23,29 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.SearchFilter, DjangoFilterBackend)
     filterset_class = IngredientFilter
     search_fields = ('^name',)
+    catalog_version_key = INGREDIENTS_VERSION_KEY
+
+    def get_catalog_response(self, request, *args, **kwargs):
+        """
+        Справочник и автодополнение отдаются из индекса в памяти,
+        без запроса к базе. С ?fuzzy=1 поиск по name допускает опечатки.
+        Прочие параметры обрабатывает queryset.
+        """
+        params = request.query_params
+        search_filter = filters.SearchFilter()
+        if params.get('fuzzy') in ('1', 'true') and params.get('name'):
+            return Response(
+                ingredient_index.fuzzy_search(
+                    params['name'],
+                    limit=settings.INGREDIENT_FUZZY_SEARCH_LIMIT,
+                    threshold=settings.INGREDIENT_FUZZY_SEARCH_THRESHOLD,
+                )
+            )
+        if set(params) - {'name', search_filter.search_param}:
+            return super().get_catalog_response(request, *args, **kwargs)
+        return Response(
+            ingredient_index.search(
+                name=params.get('name', ''),
+                terms=search_filter.get_search_terms(request),
+            )
+        )
@@ -0,0 +1,43 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from api.cache import get_version
+
+
+class CatalogCacheMixin:
+    """
+    Условный GET для справочников без пагинации.
+    ETag и Last-Modified строятся из версии справочника в кэше, поэтому
+    ответ 304 отдаётся без запросов к базе и без сериализации.
+    Справочники одинаковы для всех пользователей, поэтому аутентификация
+    не нужна, а ответ можно хранить в браузере и на шлюзе.
+    """
+    authentication_classes = ()
+    catalog_version_key = None
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(self.catalog_version_key)
+        query = hashlib.md5(
+            request.META.get('QUERY_STRING', '').encode()
+        ).hexdigest()[:12]
+        etag = quote_etag(f'{self.basename}-{version}-{query}')
+        last_modified = version // 10 ** 9
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_catalog_response(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def get_catalog_response(self, request, *args, **kwargs):
+        """Ответ на запрос, который не закрылся условным GET."""
+        return super().list(request, *args, **kwargs)
@@ -1,6 +1,243 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.cache import get_versions, table_version_key
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк таблицы по статистике планировщика Postgres.
+    None, если оценки нет: другая СУБД или таблица ещё не анализировалась.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def get_count(queryset):
+    """
+    Количество объектов для пагинации.
+    Без фильтров на большой таблице берётся оценка планировщика,
+    иначе точный COUNT(*), закэшированный по тексту запроса и версиям
+    всех участвующих таблиц на PAGINATION_COUNT_TIMEOUT секунд.
+    """
+    query = queryset.query
+    if not query.where:
+        estimate = estimate_count(queryset)
+        if (estimate is not None
+                and estimate >= settings.PAGINATION_ESTIMATE_THRESHOLD):
+            return estimate
+    try:
+        sql, params = query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    tables = sorted(
+        {alias.table_name for alias in query.alias_map.values()}
+        | {queryset.model._meta.db_table}
+    )
+    versions = get_versions(*map(table_version_key, tables))
+    key = 'count:' + hashlib.md5(
+        repr((sql, params, versions)).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+    return count
+
+
+class CountCachingPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return get_count(self.object_list)
 
 
 class MyPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    django_paginator_class = CountCachingPaginator
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (pub_date, id) от новых к старым.
+    Курсор непрозрачный: закодированные pub_date и id крайней записи
+    страницы. Каждая страница - это чтение диапазона по индексу
+    без OFFSET и без подсчёта общего количества.
+    """
+    page_size = MyPagination.page_size
+    page_size_query_param = MyPagination.page_size_query_param
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.start(request)
+        return self.finish(self.fetch(queryset))
+
+    def start(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor[2]
+
+    def fetch(self, queryset, date_field='pub_date', id_field='id'):
+        """Следующие page_size + 1 строк после курсора."""
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        if self.cursor is not None:
+            pub_date, pk, reverse = self.cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{f'{date_field}__gt': pub_date})
+                    | Q(**{date_field: pub_date, f'{id_field}__gt': pk})
+                ).order_by(date_field, id_field)
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{date_field}__lt': pub_date})
+                    | Q(**{date_field: pub_date, f'{id_field}__lt': pk})
+                )
+        return list(queryset[:self.page_size + 1])
+
+    def finish(self, page):
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk, reverse = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii')))
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError
+            return pub_date, int(pk), bool(reverse)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_key(self, obj):
+        return obj.pub_date, obj.pk
+
+    def encode_cursor(self, obj, reverse):
+        pub_date, pk = self.get_key(obj)
+        cursor = json.dumps([pub_date.isoformat(), pk, int(reverse)])
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode('ascii')
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Курсорная пагинация ленты подписок.
+    Страница собирается из диапазона ленты пользователя (рецепты,
+    разосланные при публикации) и диапазона рецептов авторов, которые
+    в ленту не рассылаются и читаются напрямую. Оба диапазона читаются
+    по индексу с одним и тем же курсором и сливаются по (pub_date, id).
+    """
+
+    def paginate_feed(self, entries, recipes, request):
+        """Ключи (pub_date, id рецепта) страницы ленты."""
+        self.start(request)
+        keys = set(self.fetch(
+            entries.values_list('pub_date', 'recipe_id'),
+            id_field='recipe_id'
+        ))
+        if recipes is not None:
+            keys.update(self.fetch(recipes.values_list('pub_date', 'id')))
+        return self.finish(sorted(keys, reverse=not self.reverse))
+
+    def get_key(self, obj):
+        return obj
+
+
+class RecipePagination(MyPagination):
+    """
+    Постраничная пагинация с подсчётом количества по умолчанию
+    и курсорная по запросу: ?pagination=cursor или ?cursor=<курсор>.
+    Результаты поиска (?search=) отсортированы по релевантности,
+    а курсор построен на (pub_date, id), поэтому для них курсорный
+    режим не включается и используется постраничная пагинация.
+    """
+    pagination_query_param = 'pagination'
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (
+            request.query_params.get(self.pagination_query_param) == 'cursor'
+            or self.keyset_pagination_class.cursor_query_param
+            in request.query_params
+        ) and not request.query_params.get(api_settings.SEARCH_PARAM):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
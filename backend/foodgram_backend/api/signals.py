@@ -0,0 +1,94 @@
+# pylint: disable=E1101
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY,
+                       bump_versions, shopping_cart_version_key,
+                       table_version_key)
+from api.foodgram.recipe_fragments import invalidate_recipe_fragments
+from api.foodgram.shopping_cart import bump_recipe_shopping_carts
+from apps.foodgram.models import (Favorite, Recipe, RecipeIngredient,
+                                  RecipeTags, ShoppingCart)
+from apps.ingredients.models import Ingredient
+from apps.tags.models import Tag
+from apps.users.models import Follow
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeTags)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Follow)
+@receiver((post_save, post_delete), sender=User)
+def table_changed(sender, **kwargs):
+    """
+    Сбрасывает закэшированные количества записей и страницы рецептов
+    по таблицам, которые участвуют в пагинируемых выборках.
+    Обработчик подключён к моделям по одной: у остальных моделей,
+    например записей ленты, нет обработчиков удаления, и каскадное
+    удаление идёт одним DELETE без загрузки объектов.
+    """
+    bump_versions(table_version_key(sender._meta.db_table))
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    bump_versions(shopping_cart_version_key(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_recipe_shopping_carts(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    bump_versions(INGREDIENTS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    bump_versions(TAGS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTags)
+def recipe_relation_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=RecipeTags)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipe_fragments([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_recipe_fragments(
+            RecipeTags.objects.filter(
+                tag=instance).values_list('recipe_id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_recipe_fragments(pk_set)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Данные автора входят в представление каждого его рецепта."""
+    if created or (
+            update_fields is not None
+            and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_recipe_fragments(
+        Recipe.objects.filter(
+            author=instance).values_list('pk', flat=True))
@@ -4,11 +4,15 @@ from rest_framework.permissions import AllowAny
 
 from apps.tags.models import Tag
 
+from api.cache import TAGS_VERSION_KEY
+from api.mixins import CatalogCacheMixin
+
 from .tags_serializers import TagSerializer
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     pagination_class = None
     permission_classes = [AllowAny, ]
     serializer_class = TagSerializer
+    catalog_version_key = TAGS_VERSION_KEY
@@ -8,8 +8,10 @@ from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from api.fields import ThumbnailField
 from apps.foodgram.models import Recipe
-from apps.users.models import Follow
+from api.users.users_utils import (get_latest_recipes, get_recipes_limit,
+                                   get_subscriptions)
 
 User = get_user_model()
 
@@ -42,10 +44,7 @@ class CustomUserSerializer(UserSerializer):
         Метод проверки наличия подписки у пользователя.
         Если подписан - True, иначе False.
         """
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return obj.id in get_subscriptions(self.context.get('request'))
 
     def get_email(self, obj):
         if hasattr(obj, 'email'):
@@ -114,9 +113,13 @@ class UserCreateSerializer(UserCreate):
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
+    image_card = ThumbnailField('card')
+    image_retina = ThumbnailField('retina')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_card', 'image_retina',
+                  'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -128,10 +131,7 @@ class FollowSerializer(serializers.ModelSerializer):
         method_name='get_recipes',
         read_only=True
     )
-    recipes_count = serializers.SerializerMethodField(
-        method_name='get_recipes_count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -143,23 +143,20 @@ class FollowSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('user')
-        if not user:
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return obj.id in get_subscriptions(self.context.get('request'))
 
     def get_recipes(self, obj):
+        """
+        Рецепты автора. Для страницы подписок view заранее загружает
+        рецепты всех авторов одним запросом и передаёт их в контексте.
+        """
         request = self.context.get('request')
-        context = {'request': request}
-        recipes_limit = request.query_params.get('recipes_limit')
-        limit = int(recipes_limit) if recipes_limit else recipes_limit
-        if Recipe.objects.filter(author=obj).exists():
-            return RecipeMinifiedSerializer(
-                Recipe.objects.filter(author=obj)[:limit],
-                context=context,
-                many=True
-            ).data
-        return []
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        recipes = self.context.get('recipes')
+        if recipes is None:
+            recipes = get_latest_recipes(
+                [obj.id], get_recipes_limit(request))
+        return RecipeMinifiedSerializer(
+            recipes.get(obj.id, []),
+            context={'request': request},
+            many=True
+        ).data
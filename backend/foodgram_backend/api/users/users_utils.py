@@ -0,0 +1,64 @@
+# pylint: disable=E1101
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from apps.foodgram.models import Recipe
+from apps.users.models import Follow
+
+SUBSCRIPTIONS_CACHE_ATTR = '_subscribed_author_ids'
+
+
+def get_subscriptions(request):
+    """
+    Множество id авторов, на которых подписан текущий пользователь.
+    Загружается одним запросом и запоминается на время запроса,
+    чтобы поле is_subscribed не делало запрос на каждого автора.
+    """
+    if request is None or request.user.is_anonymous:
+        return frozenset()
+    subscriptions = getattr(request, SUBSCRIPTIONS_CACHE_ATTR, None)
+    if subscriptions is None:
+        subscriptions = set(
+            Follow.objects.filter(
+                user=request.user
+            ).values_list('author_id', flat=True)
+        )
+        setattr(request, SUBSCRIPTIONS_CACHE_ATTR, subscriptions)
+    return subscriptions
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    return int(recipes_limit) if recipes_limit else None
+
+
+def get_latest_recipes(author_ids, limit=None):
+    """
+    Последние limit рецептов каждого из авторов одним запросом:
+    рецепты нумеруются оконной функцией ROW_NUMBER() в пределах автора,
+    а внешний запрос оставляет первые limit номеров.
+    Возвращает словарь {id автора: [рецепты от новых к старым]}.
+    """
+    queryset = Recipe.objects.filter(
+        author_id__in=author_ids
+    ).annotate(
+        recipe_rank=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )
+    ).only(
+        'id', 'name', 'image', 'image_thumbnails', 'cooking_time',
+        'author_id'
+    ).order_by()
+    sql, params = queryset.query.sql_with_params()
+    where = ''
+    if limit is not None:
+        where = 'WHERE ranked.recipe_rank <= %s'
+        params = (*params, limit)
+    recipes = {author_id: [] for author_id in author_ids}
+    for recipe in Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked {where} '
+            'ORDER BY ranked.author_id, ranked.recipe_rank', params):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
@@ -11,9 +11,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from api.pagination import MyPagination
+from apps.foodgram.relations import add_relation, remove_relation
 from apps.users.models import Follow
 
 from api.users.users_serializers import FollowSerializer
+from api.users.users_utils import get_latest_recipes, get_recipes_limit
 
 User = get_user_model()
 
@@ -39,7 +41,17 @@ class AccountViewSet(UserViewSet):
             User.objects.filter(following__user=user)
         )
         serializer = FollowSerializer(
-            pages, many=True, context={'user': user, 'request': request})
+            pages,
+            many=True,
+            context={
+                'user': user,
+                'request': request,
+                'recipes': get_latest_recipes(
+                    [author.id for author in pages],
+                    get_recipes_limit(request)
+                ),
+            }
+        )
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -61,7 +73,7 @@ class AccountViewSet(UserViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        Follow.objects.get_or_create(user=user, author=author)
+        add_relation(Follow, user=user, author=author)
         serializer = FollowSerializer(
             author,
             context={
@@ -78,7 +90,7 @@ class AccountViewSet(UserViewSet):
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
         author = get_object_or_404(User, id=id)
-        Follow.objects.filter(user=request.user, author=author).delete()
+        remove_relation(Follow, user=request.user, author=author)
         return Response(
             {
                 'message':
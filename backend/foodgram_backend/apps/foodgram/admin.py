@@ -1,7 +1,7 @@
 from django.contrib import admin
 
-from .models import (Favorite, Recipe, RecipeIngredient, RecipeTags,
-                     ShoppingCart)
+from .models import (Favorite, FeedEntry, ImageUpload, Recipe,
+                     RecipeIngredient, RecipeTags, ShoppingCart)
 
 
 class RecipeInline(admin.TabularInline):
@@ -15,7 +15,7 @@ class TagInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeModelAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'pub_date', 'cooking_time',
-                    'get_ingredient', 'get_tag')
+                    'favorites_count', 'get_ingredient', 'get_tag')
     fields = ('author', 'name', 'image',
               'text', 'cooking_time', )
     inlines = [
@@ -67,3 +67,17 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_filter = ('recipe', 'ingredient',)
     search_fields = ('recipe', 'ingredient',)
     ordering = ('recipe',)
+
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe', 'author', 'pub_date')
+    list_filter = ('user', 'author')
+    ordering = ('user', '-pub_date')
+
+
+@admin.register(ImageUpload)
+class ImageUploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'image', 'created')
+    list_filter = ('user',)
+    ordering = ('-created',)
@@ -6,3 +6,6 @@ class FoodgramConfig(AppConfig):
     label = 'foodgram'
     name = 'apps.foodgram'
     verbose_name = 'Кулинарный помощник'
+
+    def ready(self):
+        from . import signals  # noqa: F401
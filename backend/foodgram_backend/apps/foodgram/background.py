@@ -0,0 +1,46 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASK_WORKERS,
+                thread_name_prefix='background'
+            )
+    return _executor
+
+
+def run_in_background(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception(
+            'Фоновая задача %s%r завершилась ошибкой', task.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def run_after_commit(task, *args, run_async=True):
+    """
+    Выполняет task(*args) после коммита транзакции, чтобы запрос
+    не ждал долгой работы, а задача видела сохранённые данные.
+    С run_async задача ставится в очередь фоновых потоков, иначе
+    выполняется сразу после коммита в том же потоке.
+    """
+    if run_async:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_background, task, *args))
+    else:
+        transaction.on_commit(lambda: task(*args))
@@ -0,0 +1,89 @@
+# pylint: disable=E1101
+from collections import Counter, defaultdict
+
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счётчик, связь, по которой он считается, и поле внешнего ключа связи:
+# users.User.recipes_count - число рецептов с author = пользователь и т.д.
+COUNTERS = (
+    ('users.User', 'recipes_count', 'foodgram.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'author'),
+    ('users.User', 'following_count', 'users.Follow', 'user'),
+    ('foodgram.Recipe', 'favorites_count', 'foodgram.Favorite', 'recipe'),
+    ('foodgram.Recipe', 'shopping_cart_count',
+     'foodgram.ShoppingCart', 'recipe'),
+)
+
+
+def change_counters(instance, delta):
+    """
+    Изменяет на delta счётчики, которые зависят от строки instance.
+    Обновление через F() выполняется одним UPDATE в базе, поэтому
+    параллельные запросы не теряют изменения друг друга.
+    """
+    change_counters_in_bulk([instance], delta)
+
+
+def change_counters_in_bulk(instances, delta):
+    """
+    То же для строк одной модели, вставленных или удалённых пачкой
+    в обход сигналов: один UPDATE на счётчик и величину изменения.
+    """
+    if not instances:
+        return
+    label = instances[0]._meta.label
+    for model, field, related_model, foreign_key in COUNTERS:
+        if label != related_model:
+            continue
+        changes = Counter(
+            getattr(instance, f'{foreign_key}_id') for instance in instances)
+        by_amount = defaultdict(list)
+        for pk, amount in changes.items():
+            by_amount[amount * delta].append(pk)
+        for amount, pks in by_amount.items():
+            queryset = global_apps.get_model(model).objects.filter(
+                pk__in=pks)
+            if amount < 0:
+                queryset = queryset.filter(**{f'{field}__gte': -amount})
+            queryset.update(**{field: F(field) + amount})
+
+
+def get_actual_count(apps, related_model, foreign_key):
+    """Подзапрос с настоящим числом связанных строк."""
+    return Coalesce(
+        Subquery(
+            apps.get_model(related_model).objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0
+    )
+
+
+def find_counter_mismatches(apps=global_apps):
+    """Список (модель, поле, pk, значение, настоящее число) расхождений."""
+    mismatches = []
+    for model, field, related_model, foreign_key in COUNTERS:
+        rows = apps.get_model(model).objects.annotate(
+            actual=get_actual_count(apps, related_model, foreign_key)
+        ).exclude(**{field: F('actual')}).values_list('pk', field, 'actual')
+        mismatches.extend(
+            (model, field, pk, value, actual)
+            for pk, value, actual in rows
+        )
+    return mismatches
+
+
+def rebuild_counters(apps=global_apps):
+    """
+    Пересчитывает все счётчики по связанным таблицам.
+    Нужен после вставок в обход сигналов (bulk_create, миграции).
+    """
+    for model, field, related_model, foreign_key in COUNTERS:
+        apps.get_model(model).objects.update(
+            **{field: get_actual_count(apps, related_model, foreign_key)})
@@ -0,0 +1,106 @@
+# pylint: disable=E1101
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import ImageUpload, Recipe, image_storage
+from .thumbnails import SOURCE_KEY, get_thumbnail_path
+
+# Каталоги MEDIA_ROOT, которые обходит сборщик мусора.
+IMAGE_DIRECTORIES = ('recipes', 'thumbnails')
+
+
+def get_thumbnail_paths(name):
+    """Пути уменьшенных копий изображения всех текущих размеров."""
+    return [
+        get_thumbnail_path(name, size_name)
+        for size_name in settings.RECIPE_THUMBNAIL_SIZES
+    ]
+
+
+def is_image_referenced(name):
+    """Ссылаются ли на файл рецепты или незавершённые загрузки."""
+    return (
+        Recipe.objects.filter(image=name).exists()
+        or ImageUpload.objects.filter(image=name).exists()
+    )
+
+
+def get_referenced_files(uploads=None):
+    """
+    Множество файлов, на которые ссылается база: изображения рецептов
+    и загрузок uploads (по умолчанию всех), их копии по текущим
+    размерам и по image_thumbnails.
+    """
+    referenced = set()
+    rows = Recipe.objects.exclude(image='').values_list(
+        'image', 'image_thumbnails')
+    for name, thumbnails in rows.iterator():
+        referenced.add(name)
+        referenced.update(get_thumbnail_paths(name))
+        referenced.update(
+            path for key, path in thumbnails.items()
+            if key != SOURCE_KEY and path)
+    if uploads is None:
+        uploads = ImageUpload.objects.all()
+    for name in uploads.values_list('image', flat=True).iterator():
+        referenced.add(name)
+    return referenced
+
+
+def is_stale(path, grace_period):
+    """
+    Файл не менялся дольше grace_period секунд. Свежие файлы не
+    удаляются: ссылка на них может быть ещё в незавершённой транзакции.
+    """
+    try:
+        return os.path.getmtime(path) < time.time() - grace_period
+    except FileNotFoundError:
+        return False
+
+
+def delete_unreferenced_image(name):
+    """
+    Удаляет файл изображения и его копии, если на него больше никто
+    не ссылается. Возвращает, был ли файл удалён.
+    """
+    if is_image_referenced(name) or not is_stale(
+            image_storage.path(name), settings.IMAGE_GC_GRACE_PERIOD):
+        return False
+    image_storage.delete(name)
+    for path in get_thumbnail_paths(name):
+        default_storage.delete(path)
+    return True
+
+
+def release_image(name):
+    """
+    Рецепт или загрузка перестали ссылаться на файл: после коммита
+    файл удаляется, если других ссылок на те же байты нет.
+    """
+    if name:
+        transaction.on_commit(lambda: delete_unreferenced_image(name))
+
+
+def iter_media_files(directories=IMAGE_DIRECTORIES):
+    """
+    Обходит каталоги MEDIA_ROOT без построения списка файлов
+    и выдаёт пары (имя в хранилище, полный путь).
+    """
+    root = str(settings.MEDIA_ROOT)
+    stack = [os.path.join(root, directory) for directory in directories]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield (os.path.relpath(entry.path, root).replace(
+                        os.sep, '/'), entry.path)
@@ -0,0 +1,167 @@
+# pylint: disable=E1101
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections
+
+from apps.foodgram.counters import find_counter_mismatches
+from apps.foodgram.models import Favorite, Recipe, ShoppingCart
+from apps.foodgram.relations import add_relation, remove_relation
+
+User = get_user_model()
+
+MODELS = {
+    'favorite': Favorite,
+    'shopping_cart': ShoppingCart,
+}
+
+
+def add_with_orm(model, **fields):
+    """Прежний путь: exists() и create()."""
+    if model.objects.filter(**fields).exists():
+        return False
+    model.objects.create(**fields)
+    return True
+
+
+def remove_with_orm(model, **fields):
+    """Прежний путь: exists(), get() и delete()."""
+    if not model.objects.filter(**fields).exists():
+        return False
+    model.objects.get(**fields).delete()
+    return True
+
+
+PATHS = {
+    'service': (add_relation, remove_relation),
+    'orm': (add_with_orm, remove_with_orm),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка добавления и удаления избранного или '
+        'списка покупок из нескольких потоков: задержки, ошибки '
+        'уникальности и согласованность счётчиков. Пользователи и '
+        'рецепты для проверки создаются заново и удаляются после неё.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=sorted(MODELS), default='favorite')
+        parser.add_argument(
+            '--path', choices=sorted(PATHS), default='service',
+            help='service - общий сервис связей, orm - exists() и create().'
+        )
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--iterations', type=int, default=200,
+            help='Добавлений и удалений на поток.'
+        )
+        parser.add_argument(
+            '--pairs', type=int, default=5,
+            help='Число пар пользователь-рецепт, за которые '
+                 'соревнуются потоки.'
+        )
+
+    def create_pairs(self, model, count):
+        """
+        Отдельные пользователи и рецепты для проверки, чтобы не трогать
+        избранное и списки покупок настоящих пользователей.
+        """
+        prefix = f'benchmark-{uuid.uuid4().hex[:8]}'
+        users = []
+        for number in range(count):
+            user = User(
+                username=f'{prefix}-{number}',
+                email=f'{prefix}-{number}@example.com',
+                first_name='Нагрузочная',
+                last_name='Проверка',
+            )
+            user.set_unusable_password()
+            user.save()
+            users.append(user)
+        return [
+            (model, {
+                'user': user,
+                'recipe': Recipe.objects.create(
+                    author=user,
+                    name=f'{prefix}-{user.username}',
+                    text='Рецепт нагрузочной проверки.',
+                    cooking_time=1,
+                ),
+            })
+            for user in users
+        ]
+
+    def handle(self, *args, **options):
+        model = MODELS[options['model']]
+        self.add, self.remove = PATHS[options['path']]
+        if options['pairs'] < 1:
+            raise CommandError('Нужна хотя бы одна пара.')
+        self.pairs = self.create_pairs(model, options['pairs'])
+        try:
+            self.run(options)
+        finally:
+            User.objects.filter(
+                pk__in=[fields['user'].pk for _, fields in self.pairs]
+            ).delete()
+
+    def run(self, options):
+        started = time.perf_counter()
+        if options['threads'] == 1:
+            results = [self.work(0, options['iterations'])]
+        else:
+            with ThreadPoolExecutor(options['threads']) as executor:
+                results = list(executor.map(
+                    self.work_in_thread,
+                    range(options['threads']),
+                    [options['iterations']] * options['threads']
+                ))
+        elapsed = time.perf_counter() - started
+
+        for operation in ('add', 'remove'):
+            latencies = sorted(
+                latency for result in results
+                for latency in result[operation])
+            self.stdout.write(
+                f'{operation}: {len(latencies)} операций, '
+                f'{len(latencies) / elapsed:.0f} оп/с, '
+                f'медиана {statistics.median(latencies) * 1000:.2f} мс, '
+                f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} мс'
+            )
+        errors = sum(result['errors'] for result in results)
+        mismatches = len(find_counter_mismatches())
+        self.stdout.write(f'Ошибок из-за гонок: {errors}')
+        self.stdout.write(f'Расхождений в счётчиках: {mismatches}')
+        if errors or mismatches:
+            raise CommandError('Проверка не пройдена.')
+        self.stdout.write(self.style.SUCCESS('Проверка пройдена.'))
+
+    def work_in_thread(self, number, iterations):
+        try:
+            return self.work(number, iterations)
+        finally:
+            connections.close_all()
+
+    def work(self, number, iterations):
+        """
+        Поток по очереди добавляет и удаляет общие для всех потоков
+        пары, так что одновременные добавления одной пары неизбежны.
+        """
+        result = {'add': [], 'remove': [], 'errors': 0}
+        for iteration in range(iterations):
+            model, fields = self.pairs[
+                (number + iteration) % len(self.pairs)]
+            for operation in ('add', 'remove'):
+                started = time.perf_counter()
+                try:
+                    getattr(self, operation)(model, **fields)
+                except (IntegrityError, model.DoesNotExist):
+                    result['errors'] += 1
+                result[operation].append(time.perf_counter() - started)
+        return result
@@ -0,0 +1,64 @@
+# pylint: disable=E1101
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.foodgram.images import (get_referenced_files, is_stale,
+                                  iter_media_files)
+from apps.foodgram.models import ImageUpload
+from apps.foodgram.relations import delete_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Сборка мусора в каталогах изображений: удаляет файлы, на '
+        'которые не ссылаются ни рецепты, ни незавершённые загрузки, '
+        'а также загрузки, не привязанные к рецепту за '
+        'IMAGE_UPLOAD_MAX_AGE.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+        parser.add_argument(
+            '--grace-period', type=int,
+            default=settings.IMAGE_GC_GRACE_PERIOD,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+
+    def handle(self, *args, **options):
+        stale_uploads = ImageUpload.objects.filter(
+            created__lt=timezone.now() - timedelta(
+                seconds=settings.IMAGE_UPLOAD_MAX_AGE))
+        stale_upload_ids = list(stale_uploads.values_list('pk', flat=True))
+        if not options['dry_run']:
+            delete_rows(ImageUpload, pk__in=stale_upload_ids)
+        referenced = get_referenced_files(
+            ImageUpload.objects.exclude(pk__in=stale_upload_ids))
+
+        removed = freed = 0
+        for name, path in iter_media_files():
+            if name in referenced or not is_stale(
+                    path, options['grace_period']):
+                continue
+            try:
+                size = os.path.getsize(path)
+                if not options['dry_run']:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{action} устаревших загрузок: {len(stale_upload_ids)}, '
+                f'файлов: {removed}, {freed / (1024 * 1024):.1f} МБ.'))
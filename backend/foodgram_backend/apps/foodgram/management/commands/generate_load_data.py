@@ -0,0 +1,233 @@
+# pylint: disable=E1101
+import random
+from itertools import accumulate, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from apps.foodgram.counters import rebuild_counters
+from apps.foodgram.models import (Favorite, FeedEntry, Recipe,
+                                  RecipeIngredient, RecipeTags, ShoppingCart)
+from apps.foodgram.search import update_search_vector
+from apps.ingredients.models import Ingredient
+from apps.tags.models import Tag
+from apps.users.models import Follow
+
+User = get_user_model()
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+PASSWORD = 'loaddata-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация нагрузочных данных: пользователи, рецепты, подписки, '
+        'избранное и список покупок. Ингредиенты должны быть загружены '
+        'заранее командой load_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=10)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--favorites', type=int, default=100000)
+        parser.add_argument('--shopping-carts', type=int, default=20000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности '
+                 'авторов и рецептов (0 - равномерно).'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if len(ingredient_ids) < options['ingredients_per_recipe']:
+            raise CommandError(
+                'Недостаточно ингредиентов, сначала выполните load_data.')
+
+        with transaction.atomic():
+            tag_ids = self.create_tags()
+            user_ids = self.create_users(options['users'])
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids)
+            self.bulk_create(
+                RecipeIngredient,
+                (
+                    RecipeIngredient(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=self.random.randint(1, 500),
+                    )
+                    for recipe_id in recipe_ids
+                    for ingredient_id in self.random.sample(
+                        ingredient_ids, options['ingredients_per_recipe'])
+                )
+            )
+            self.bulk_create(
+                RecipeTags,
+                (
+                    RecipeTags(recipe_id=recipe_id, tag_id=tag_id)
+                    for recipe_id in recipe_ids
+                    for tag_id in self.random.sample(
+                        tag_ids, min(options['tags_per_recipe'],
+                                     len(tag_ids)))
+                )
+            )
+            self.bulk_create(
+                Follow,
+                (
+                    Follow(user_id=user_id, author_id=author_id)
+                    for user_id, author_id in self.skewed_pairs(
+                        user_ids, user_ids, options['follows'])
+                    if user_id != author_id
+                )
+            )
+            self.bulk_create(
+                Favorite,
+                (
+                    Favorite(user_id=user_id, recipe_id=recipe_id)
+                    for user_id, recipe_id in self.skewed_pairs(
+                        user_ids, recipe_ids, options['favorites'])
+                )
+            )
+            self.bulk_create(
+                ShoppingCart,
+                (
+                    ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                    for user_id, recipe_id in self.skewed_pairs(
+                        user_ids, recipe_ids, options['shopping_carts'])
+                )
+            )
+            self.update_search_vectors(recipe_ids)
+            rebuild_counters()
+            self.fill_feeds(user_ids)
+        self.stdout.write(
+            self.style.SUCCESS('Генерация данных прошла успешно.'))
+
+    def bulk_create(self, model, objects):
+        """Вставка объектов пачками по batch_size, не держа всё в памяти."""
+        total = 0
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+
+    def update_search_vectors(self, recipe_ids):
+        """
+        Рецепты и их ингредиенты вставлены через bulk_create, поэтому
+        поисковый вектор пересчитывается отдельно, пачками по batch_size.
+        """
+        for start in range(0, len(recipe_ids), self.batch_size):
+            update_search_vector(recipe_ids[start:start + self.batch_size])
+
+    def fill_feeds(self, user_ids):
+        """
+        Подписки и рецепты вставлены в обход сигналов, поэтому ленты
+        заполняются после пересчёта счётчиков: так же, как при
+        подписке, для авторов, которые рассылаются в ленты.
+        """
+        authors = User.objects.filter(
+            id__in=user_ids,
+            followers_count__gt=0,
+            followers_count__lte=settings.FEED_FAN_OUT_MAX_FOLLOWERS,
+        ).values_list('id', flat=True)
+        for author_id in authors.iterator():
+            FeedEntry.objects.backfill_followers(author_id)
+        self.stdout.write(
+            f'{FeedEntry._meta.verbose_name_plural}: '
+            f'{FeedEntry.objects.count()}')
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, count):
+        start = User.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        password = make_password(PASSWORD)
+        self.bulk_create(
+            User,
+            (
+                User(
+                    email=f'loaduser{number}@foodgram.local',
+                    username=f'loaduser{number}',
+                    first_name='Пользователь',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(start + 1, start + count + 1)
+            )
+        )
+        return list(
+            User.objects.filter(
+                id__gt=start).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, count, user_ids):
+        start = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        authors = self.skewed_choices(user_ids, count)
+        self.bulk_create(
+            Recipe,
+            (
+                Recipe(
+                    author_id=author_id,
+                    name=f'Рецепт {start + number}',
+                    text='Описание рецепта для нагрузочного тестирования.',
+                    cooking_time=self.random.randint(1, 240),
+                )
+                for number, author_id in enumerate(authors, start=1)
+            )
+        )
+        return list(
+            Recipe.objects.filter(
+                id__gt=start).order_by('id').values_list('id', flat=True))
+
+    def zipf_weights(self, size):
+        """
+        Накопленные веса распределения Ципфа: первые элементы популярнее,
+        как популярные авторы и рецепты в реальных данных.
+        """
+        return list(accumulate(
+            1 / (rank ** self.skew) for rank in range(1, size + 1)))
+
+    def skewed_choices(self, population, count):
+        return self.random.choices(
+            population, cum_weights=self.zipf_weights(len(population)),
+            k=count)
+
+    def skewed_pairs(self, users, targets, count):
+        """Уникальные пары (пользователь, популярный объект)."""
+        cum_weights = self.zipf_weights(len(targets))
+        pairs = {}
+        attempts = 0
+        while len(pairs) < count and attempts < count * 3:
+            batch = min(count - len(pairs), self.batch_size)
+            attempts += batch
+            pairs.update(dict.fromkeys(zip(
+                self.random.choices(users, k=batch),
+                self.random.choices(
+                    targets, cum_weights=cum_weights, k=batch),
+            )))
+        return pairs
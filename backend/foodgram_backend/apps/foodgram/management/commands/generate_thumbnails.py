@@ -0,0 +1,38 @@
+# pylint: disable=E1101
+from django.core.management.base import BaseCommand
+
+from apps.foodgram.models import Recipe
+from apps.foodgram.thumbnails import (generate_thumbnails,
+                                      thumbnails_are_current)
+
+
+class Command(BaseCommand):
+    help = (
+        'Построение WebP-копий изображений рецептов, у которых их ещё '
+        'нет или которые устарели после замены изображения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии всех изображений, например после '
+                 'изменения RECIPE_THUMBNAIL_SIZES.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_thumbnails').order_by('id')
+        generated = failed = 0
+        for recipe in recipes.iterator():
+            if thumbnails_are_current(recipe) and not options['all']:
+                continue
+            try:
+                if generate_thumbnails(recipe.id, force=options['all']):
+                    generated += 1
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Построены копии для {generated} рецептов, '
+                f'ошибок: {failed}.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.foodgram.counters import find_counter_mismatches, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка и пересчёт счётчиков рецептов, подписок, избранного '
+        'и списка покупок по связанным таблицам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить счётчики, не исправляя их.'
+        )
+
+    def handle(self, *args, **options):
+        mismatches = find_counter_mismatches()
+        for model, field, pk, value, actual in mismatches:
+            self.stdout.write(
+                f'{model} {pk}: {field} = {value}, на самом деле {actual}')
+        if options['check']:
+            if mismatches:
+                raise CommandError(
+                    f'Расхождений в счётчиках: {len(mismatches)}.')
+            self.stdout.write(self.style.SUCCESS('Счётчики в порядке.'))
+            return
+        with transaction.atomic():
+            rebuild_counters()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Счётчики пересчитаны, исправлено: {len(mismatches)}.'))
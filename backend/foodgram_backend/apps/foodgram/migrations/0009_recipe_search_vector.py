@@ -0,0 +1,52 @@
+# Generated by Django 3.2.19 on 2026-10-18 18:20
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# GIN-индекс и tsvector есть только в Postgres, поэтому индекс создаётся
+# вручную и только там: на SQLite в тестах поиск работает через icontains.
+CREATE_INDEX = (
+    'CREATE INDEX recipe_search_vector_idx '
+    'ON foodgram_recipe USING gin (search_vector)'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS recipe_search_vector_idx'
+FILL_SEARCH_VECTOR = """
+UPDATE foodgram_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', recipe.name), 'A')
+    || setweight(to_tsvector('russian', recipe.text), 'B')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM foodgram_recipeingredient AS recipe_ingredient
+        JOIN ingredients_ingredient AS ingredient
+            ON ingredient.id = recipe_ingredient.ingredient_id
+        WHERE recipe_ingredient.recipe_id = recipe.id
+    ), '')), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+        schema_editor.execute(FILL_SEARCH_VECTOR)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0008_auto_20261018_1817'),
+        ('ingredients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.19 on 2026-10-18 18:24
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счётчики на момент этой миграции. Определения скопированы сюда,
+# чтобы последующие изменения apps.foodgram.counters её не меняли.
+COUNTERS = (
+    ('users.User', 'recipes_count', 'foodgram.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'author'),
+    ('users.User', 'following_count', 'users.Follow', 'user'),
+    ('foodgram.Recipe', 'favorites_count', 'foodgram.Favorite', 'recipe'),
+    ('foodgram.Recipe', 'shopping_cart_count',
+     'foodgram.ShoppingCart', 'recipe'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, related_model, foreign_key in COUNTERS:
+        actual = Coalesce(
+            Subquery(
+                apps.get_model(related_model).objects.filter(
+                    **{foreign_key: OuterRef('pk')}
+                ).order_by().values(foreign_key).annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField(),
+            ),
+            0
+        )
+        apps.get_model(model).objects.update(**{field: actual})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0009_recipe_search_vector'),
+        ('users', '0002_auto_20261018_1824'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
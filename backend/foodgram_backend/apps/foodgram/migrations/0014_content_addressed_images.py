@@ -0,0 +1,24 @@
+# Generated by Django 3.2.19 on 2026-10-18 18:42
+
+import apps.foodgram.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0013_imageupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imageupload',
+            name='image',
+            field=models.ImageField(db_index=True, storage=apps.foodgram.storage.ContentAddressedStorage(), upload_to='recipes', verbose_name='Изображение'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, help_text='Загрузите изображение', storage=apps.foodgram.storage.ContentAddressedStorage(), upload_to='recipes', verbose_name='Изображение'),
+        ),
+    ]
@@ -1,11 +1,22 @@
+import uuid
+
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
 
 from foodgram_backend.settings import LENGTH_HEADER, MAX_LENGTH_NAME
 
 from apps.ingredients.models import Ingredient
 from apps.tags.models import Tag
+from apps.users.models import Follow
+
+from .background import run_after_commit
+from .relations import delete_rows
+from .storage import ContentAddressedStorage
+
+image_storage = ContentAddressedStorage()
 
 
 class Recipe(models.Model):
@@ -27,8 +38,10 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение',
         help_text='Загрузите изображение',
-        upload_to='recipes/%Y/%m/%d',
-        blank=True
+        upload_to='recipes',
+        storage=image_storage,
+        blank=True,
+        db_index=True,
     )
     text = models.TextField(
         verbose_name='Текстовое описание',
@@ -57,11 +70,35 @@ class Recipe(models.Model):
         ),
         help_text='Введите время приготовления (ед. измерения в минутах))',
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    image_thumbnails = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         indexes = [
             models.Index(fields=['name']),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
         ]
         verbose_name_plural = 'Рецепты'
         verbose_name = 'Рецепт'
@@ -203,3 +240,220 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return (f"Рецепт: '{self.recipe}' добавлен в список покупок"
                 f"пользователю: '{self.user.username}'")
+
+
+class FeedEntryManager(models.Manager):
+    """
+    Лента рецептов от авторов, на которых подписан пользователь.
+    Записи рассылаются подписчикам при публикации рецепта, добавляются
+    при подписке и удаляются при отписке. Авторы, у которых больше
+    FEED_FAN_OUT_MAX_FOLLOWERS подписчиков, в ленты не рассылаются:
+    их рецепты читаются напрямую при просмотре ленты.
+    """
+
+    def is_fanned_out(self, author_id):
+        return get_user_model().objects.filter(
+            pk=author_id,
+            followers_count__lte=settings.FEED_FAN_OUT_MAX_FOLLOWERS
+        ).exists()
+
+    def fan_out(self, recipe):
+        """Рассылает новый рецепт в ленты подписчиков автора."""
+        if not self.is_fanned_out(recipe.author_id):
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    recipe_id=recipe.pk,
+                    author_id=recipe.author_id,
+                    pub_date=recipe.pub_date,
+                )
+                for user_id in Follow.objects.filter(
+                    author_id=recipe.author_id
+                ).values_list('user_id', flat=True).iterator()
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту нового подписчика последние рецепты автора."""
+        if not self.is_fanned_out(author_id):
+            return
+        recipes = Recipe.objects.filter(
+            author_id=author_id
+        ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in recipes
+            ),
+            ignore_conflicts=True,
+        )
+
+    def backfill_followers(self, author_id):
+        """
+        Добавляет последние FEED_BACKFILL_LIMIT рецептов автора в ленты
+        всех его подписчиков одним INSERT ... SELECT в базе.
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        feed = self.model._meta
+        follow = Follow._meta
+        recipe = Recipe._meta
+        sql = (
+            'INSERT INTO {feed} ({user}, {recipe_id}, {author}, {pub_date}) '
+            'SELECT f.{follower}, r.{id}, r.{recipe_author}, r.{pub_date} '
+            'FROM {follow} f JOIN ('
+            'SELECT {id}, {recipe_author}, {pub_date} FROM {recipe} '
+            'WHERE {recipe_author} = %s '
+            'ORDER BY {pub_date} DESC, {id} DESC LIMIT %s'
+            ') r ON r.{recipe_author} = f.{followed} '
+            'WHERE f.{followed} = %s '
+            'ON CONFLICT DO NOTHING'
+        ).format(
+            feed=quote(feed.db_table),
+            user=quote(feed.get_field('user').column),
+            recipe_id=quote(feed.get_field('recipe').column),
+            author=quote(feed.get_field('author').column),
+            pub_date=quote(feed.get_field('pub_date').column),
+            follow=quote(follow.db_table),
+            follower=quote(follow.get_field('user').column),
+            followed=quote(follow.get_field('author').column),
+            recipe=quote(recipe.db_table),
+            id=quote(recipe.pk.column),
+            recipe_author=quote(recipe.get_field('author').column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql, [author_id, settings.FEED_BACKFILL_LIMIT, author_id])
+
+    def refill_followers(self, author_id):
+        """
+        Заполняет ленты подписчиков автора, если его рецепты всё ещё
+        рассылаются: к запуску задачи подписчиков могло снова стать
+        больше порога.
+        """
+        if self.is_fanned_out(author_id):
+            self.backfill_followers(author_id)
+
+    def follower_removed(self, author_id):
+        """
+        Пока у автора было больше FEED_FAN_OUT_MAX_FOLLOWERS подписчиков,
+        его рецепты в ленты не рассылались. Когда число подписчиков
+        снова опускается до порога, ленты заполняются заново, иначе
+        эти рецепты пропали бы и из записей ленты, и из прямого чтения.
+        Заполнение затрагивает до FEED_FAN_OUT_MAX_FOLLOWERS лент,
+        поэтому идёт в фоне после коммита, а не в запросе отписки.
+        """
+        if get_user_model().objects.filter(
+            pk=author_id,
+            followers_count=settings.FEED_FAN_OUT_MAX_FOLLOWERS
+        ).exists():
+            run_after_commit(
+                self.refill_followers, author_id,
+                run_async=settings.FEED_BACKFILL_ASYNC)
+
+    def remove(self, user_id, author_id):
+        """
+        Убирает рецепты автора из ленты отписавшегося пользователя.
+        Одним DELETE: на записях ленты нет обработчиков удаления.
+        """
+        delete_rows(self.model, user_id=user_id, author_id=author_id)
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписок: рецепт автора в ленте подписчика.
+    Автор и дата публикации скопированы из рецепта, чтобы страница
+    ленты читалась по одному индексу (user, pub_date, recipe).
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry',
+            ),
+        )
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class ImageUpload(models.Model):
+    """
+    Изображение, загруженное отдельным multipart-запросом до
+    сохранения рецепта. Рецепт получает его по token, файл при этом
+    не копируется: он уже лежит в каталоге изображений рецептов.
+    """
+    token = models.UUIDField(
+        verbose_name='Токен',
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='image_uploads',
+    )
+    image = models.ImageField(
+        verbose_name='Изображение',
+        upload_to='recipes',
+        storage=image_storage,
+        db_index=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата загрузки',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Загруженное изображение'
+        verbose_name_plural = 'Загруженные изображения'
+
+    def __str__(self):
+        return f'{self.image.name} от {self.user}'
@@ -0,0 +1,121 @@
+# pylint: disable=E1101
+from django.db import connections, models, router
+from django.db.models.signals import post_delete, post_save
+
+
+def get_column_value(model, connection, name, value):
+    """Столбец поля name и значение для SQL; вместо объекта берётся pk."""
+    meta = model._meta
+    field = meta.pk if name == 'pk' else meta.get_field(name)
+    if isinstance(value, models.Model):
+        value = value.pk
+    return field.column, field.get_db_prep_value(value, connection)
+
+
+def execute(connection, sql, params, returning):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning is None:
+            return cursor.rowcount
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_returning_sql(model, connection, returning):
+    if returning is None:
+        return ''
+    return ' RETURNING ' + connection.ops.quote_name(
+        model._meta.get_field(returning).column)
+
+
+def insert_rows(model, rows, returning=None):
+    """
+    Вставляет строки одним INSERT ... ON CONFLICT DO NOTHING.
+    Конфликтующие строки пропускаются без ошибки. Возвращает число
+    вставленных строк, а с returning - значения этого поля у строк,
+    которые вставил именно этот запрос.
+    """
+    if not rows:
+        return 0 if returning is None else []
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    values = [
+        [get_column_value(model, connection, name, value)
+         for name, value in fields.items()]
+        for fields in rows
+    ]
+    row_sql = '({})'.format(', '.join(['%s'] * len(values[0])))
+    sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING{}'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(column) for column, _ in values[0]),
+        ', '.join([row_sql] * len(rows)),
+        get_returning_sql(model, connection, returning),
+    )
+    params = [value for row in values for _, value in row]
+    return execute(connection, sql, params, returning)
+
+
+def delete_rows(model, returning=None, **lookups):
+    """
+    Удаляет строки одним DELETE без загрузки объектов и без сигналов.
+    Условия - равенство поля значению или name__in=[...]. Возвращает
+    число удалённых строк, а с returning - значения этого поля у строк,
+    которые удалил именно этот запрос.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    conditions = []
+    params = []
+    for name, value in lookups.items():
+        if name.endswith('__in'):
+            items = [
+                get_column_value(model, connection, name[:-4], item)
+                for item in value
+            ]
+            if not items:
+                return 0 if returning is None else []
+            conditions.append('{} IN ({})'.format(
+                quote(items[0][0]), ', '.join(['%s'] * len(items))))
+            params.extend(prepared for _, prepared in items)
+        else:
+            column, prepared = get_column_value(
+                model, connection, name, value)
+            conditions.append(f'{quote(column)} = %s')
+            params.append(prepared)
+    sql = 'DELETE FROM {} WHERE {}{}'.format(
+        quote(model._meta.db_table),
+        ' AND '.join(conditions),
+        get_returning_sql(model, connection, returning),
+    )
+    return execute(connection, sql, params, returning)
+
+
+def add_relation(model, **fields):
+    """
+    Создаёт связь (избранное, список покупок, подписку) одним
+    INSERT ... ON CONFLICT DO NOTHING. Повторное или одновременное
+    добавление не падает на ограничении уникальности, а возвращает
+    False. Сигналы post_save отправляются только если строка
+    действительно вставлена, поэтому счётчики и кэши меняются
+    ровно один раз.
+    """
+    created = insert_rows(model, [fields]) > 0
+    if created:
+        post_save.send(
+            sender=model, instance=model(**fields), created=True,
+            update_fields=None, raw=False,
+            using=router.db_for_write(model))
+    return created
+
+
+def remove_relation(model, **fields):
+    """
+    Удаляет связь одним DELETE и возвращает, была ли она.
+    Из одновременных удалений post_delete получает только то,
+    которое действительно удалило строку.
+    """
+    deleted = delete_rows(model, **fields) > 0
+    if deleted:
+        post_delete.send(
+            sender=model, instance=model(**fields),
+            using=router.db_for_write(model))
+    return deleted
@@ -0,0 +1,38 @@
+# pylint: disable=E1101
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connections
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+
+
+def update_search_vector(recipe_ids):
+    """
+    Пересчитывает поисковый вектор рецептов: название (вес A),
+    описание (вес B) и названия ингредиентов (вес C).
+    Вектор есть только в Postgres, на других СУБД поиск идёт
+    по icontains и пересчитывать нечего.
+    """
+    queryset = Recipe.objects.filter(pk__in=recipe_ids)
+    if connections[queryset.db].vendor != 'postgresql':
+        return
+    ingredient_names = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', delimiter=' ')
+    ).values('names')
+    queryset.update(
+        search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(Subquery(ingredient_names), Value('')),
+                weight='C',
+                config=SEARCH_CONFIG
+            )
+        )
+    )
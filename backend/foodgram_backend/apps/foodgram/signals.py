@@ -0,0 +1,114 @@
+# pylint: disable=E1101
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from apps.ingredients.models import Ingredient
+from apps.users.models import Follow
+
+from .counters import change_counters
+from .images import release_image
+from .models import (Favorite, FeedEntry, ImageUpload, Recipe,
+                     RecipeIngredient, ShoppingCart)
+from .search import update_search_vector
+from .thumbnails import schedule_thumbnails, thumbnails_are_current
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    """Название ингредиента входит в поисковый вектор его рецептов."""
+    if not created:
+        update_search_vector(
+            RecipeIngredient.objects.filter(
+                ingredient=instance
+            ).values('recipe_id')
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_text_changed(sender, instance, update_fields, **kwargs):
+    """Название и описание рецепта входят в его поисковый вектор."""
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        update_search_vector([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """
+    Ингредиенты рецепта входят в его поисковый вектор. Вектор
+    пересчитывается при любой записи строки: из API, из админки
+    и при каскадном удалении ингредиента.
+    """
+    update_search_vector([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def counted_object_created(sender, instance, created, **kwargs):
+    if created:
+        change_counters(instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def counted_object_deleted(sender, instance, **kwargs):
+    change_counters(instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    FeedEntry.objects.remove(instance.user_id, instance.author_id)
+    FeedEntry.objects.follower_removed(instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    """Копии изображения строятся в фоне после сохранения рецепта."""
+    if not thumbnails_are_current(instance):
+        schedule_thumbnails(instance.pk)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_recipe_image(sender, instance, **kwargs):
+    """
+    Запоминает имя загруженного из базы изображения, чтобы после
+    замены освободить старый файл. Отложенное поле не читается.
+    """
+    image = instance.__dict__.get('image')
+    instance._saved_image = getattr(image, 'name', image) or None
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_replaced(sender, instance, created, **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    image = instance.image.name or None
+    if not created and instance._saved_image != image:
+        release_image(instance._saved_image)
+    instance._saved_image = image
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=ImageUpload)
+def image_owner_deleted(sender, instance, **kwargs):
+    """
+    Файл удалённого рецепта или использованной либо устаревшей
+    загрузки удаляется, если на те же байты больше нет ссылок.
+    """
+    if 'image' in instance.__dict__:
+        release_image(instance.image.name)
@@ -0,0 +1,47 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, в котором имя файла - SHA-256 содержимого:
+    recipes/ab/cd/abcd...ef.png. Одинаковые байты записываются
+    на диск один раз, повторное сохранение возвращает имя уже
+    лежащего файла и обновляет время его изменения, чтобы сборщик
+    мусора не удалил файл, пока ссылка на него не сохранена в базе.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        _, extension = os.path.splitext(name)
+        return (f'{directory}/{hexdigest[:2]}/{hexdigest[2:4]}/'
+                f'{hexdigest}{extension.lower()}').lstrip('/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        # Файл пишется под временным именем и переименовывается,
+        # так что одновременные сохранения одних и тех же байт
+        # не оставляют ни дубликатов, ни недописанного файла.
+        # Длина имени постоянна, max_length к временному не относится.
+        temporary_name = super().save(
+            f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary_name), self.path(name))
+        return name
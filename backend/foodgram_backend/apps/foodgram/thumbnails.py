@@ -0,0 +1,105 @@
+# pylint: disable=E1101
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .background import run_after_commit
+from .models import Recipe
+
+SOURCE_KEY = 'source'
+
+
+def get_thumbnail_path(image_name, size_name):
+    stem, _ = os.path.splitext(image_name)
+    return f'thumbnails/{stem}_{size_name}.webp'
+
+
+def thumbnails_are_current(recipe):
+    return recipe.image_thumbnails.get(SOURCE_KEY) == (
+        recipe.image.name or None)
+
+
+def get_thumbnail_url(recipe, size_name):
+    """
+    Адрес уменьшенной копии изображения. Пока копии не готовы
+    (или изображение заменено), отдаётся адрес оригинала.
+    """
+    if not recipe.image:
+        return None
+    if thumbnails_are_current(recipe):
+        path = recipe.image_thumbnails.get(size_name)
+        if path:
+            return default_storage.url(path)
+    return recipe.image.url
+
+
+def render_thumbnail(image, size):
+    thumbnail = image.copy()
+    thumbnail.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    thumbnail.save(
+        buffer, 'WEBP', quality=settings.RECIPE_THUMBNAIL_QUALITY,
+        method=6)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_thumbnails(recipe_id, force=False):
+    """
+    Строит WebP-копии изображения рецепта всех размеров из
+    RECIPE_THUMBNAIL_SIZES и сохраняет пути к ним в image_thumbnails
+    вместе с именем исходного файла. Если изображение успели
+    заменить, результат не сохраняется: для нового изображения
+    уже запланирована своя задача. Возвращает, построены ли копии.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or (thumbnails_are_current(recipe) and not force):
+        return False
+    source = recipe.image.name or None
+    thumbnails = {SOURCE_KEY: source}
+    if source:
+        # Имя изображения - хэш содержимого, поэтому готовые копии
+        # того же файла у другого рецепта строить заново не нужно.
+        missing = {
+            size_name: size
+            for size_name, size in settings.RECIPE_THUMBNAIL_SIZES.items()
+            if force or not default_storage.exists(
+                get_thumbnail_path(source, size_name))
+        }
+        if missing:
+            with recipe.image.open('rb') as file:
+                image = ImageOps.exif_transpose(Image.open(file))
+                image.load()
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+        for size_name in settings.RECIPE_THUMBNAIL_SIZES:
+            path = get_thumbnail_path(source, size_name)
+            if size_name in missing:
+                if default_storage.exists(path):
+                    default_storage.delete(path)
+                path = default_storage.save(
+                    path, render_thumbnail(image, missing[size_name]))
+            thumbnails[size_name] = path
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id).first()
+        if recipe is None or (recipe.image.name or None) != source:
+            return False
+        recipe.image_thumbnails = thumbnails
+        recipe.save(update_fields=['image_thumbnails'])
+    return True
+
+
+def schedule_thumbnails(recipe_id):
+    """
+    Ставит построение копий в очередь после коммита транзакции,
+    чтобы запрос не ждал обработки изображения, а поток видел
+    сохранённый рецепт.
+    """
+    run_after_commit(
+        generate_thumbnails, recipe_id,
+        run_async=settings.RECIPE_THUMBNAILS_ASYNC)
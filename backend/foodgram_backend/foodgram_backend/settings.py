@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'django_filters',
@@ -83,6 +84,85 @@ DATABASES = {
     }
 }
 
+# Версии данных в кэше сбрасывают индекс ингредиентов, ETag каталогов,
+# фрагменты и страницы рецептов во всех процессах, поэтому в docker
+# compose используется общий memcached. LocMemCache виден только
+# своему процессу и годится для разработки с одним процессом.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'default'),
+        'OPTIONS': (
+            {'MAX_ENTRIES': 10000}
+            if CACHE_BACKEND.endswith('LocMemCache') else {}
+        ),
+    },
+    'shopping_cart': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shopping_cart',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+
+SHOPPING_CART_CACHE = 'shopping_cart'
+
+CATALOG_CACHE_MAX_AGE = 60 * 10
+
+PAGINATION_COUNT_TIMEOUT = 60
+
+PAGINATION_ESTIMATE_THRESHOLD = 100000
+
+INGREDIENT_FUZZY_SEARCH_LIMIT = 10
+
+INGREDIENT_FUZZY_SEARCH_THRESHOLD = 0.15
+
+FEED_FAN_OUT_MAX_FOLLOWERS = 10000
+
+FEED_BACKFILL_LIMIT = 100
+
+FEED_BATCH_SIZE = 1000
+
+FEED_BACKFILL_ASYNC = True
+
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+RECIPE_PAGE_CACHE_TIMEOUT = 60
+
+BULK_RECIPES_MAX_SIZE = 100
+
+RECIPE_THUMBNAIL_SIZES = {
+    'card': (400, 300),
+    'detail': (800, 600),
+    'retina': (1600, 1200),
+}
+
+RECIPE_THUMBNAIL_QUALITY = 80
+
+RECIPE_THUMBNAILS_ASYNC = True
+
+BACKGROUND_TASK_WORKERS = 2
+
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+IMAGE_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+
+IMAGE_UPLOAD_MAX_AGE = 60 * 60 * 24
+
+IMAGE_GC_GRACE_PERIOD = 60 * 60
+
+IMAGE_UPLOAD_CONTENT_TYPES = (
+    'image/jpeg',
+    'image/png',
+    'image/webp',
+    'image/gif',
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
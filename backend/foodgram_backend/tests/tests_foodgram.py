@@ -1,12 +1,33 @@
+import base64
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
 from http import HTTPStatus
+from io import BytesIO, StringIO
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
+from PIL import Image
 from rest_framework.test import APIClient
 
-from apps.foodgram.models import (Favorite, Ingredient, Recipe,
-                                  RecipeIngredient, ShoppingCart, Tag)
+from api.foodgram.recipe_fragments import recipe_fragment_key
+from api.foodgram.shopping_cart import (get_shopping_list,
+                                        get_shopping_list_cache_stats)
+from apps.foodgram.counters import find_counter_mismatches
+from apps.foodgram.relations import add_relation, remove_relation
+from apps.foodgram.models import (Favorite, FeedEntry, ImageUpload,
+                                  Ingredient, Recipe, RecipeIngredient,
+                                  ShoppingCart, Tag)
 from apps.users.models import Follow
 
 User = get_user_model()
@@ -121,6 +142,212 @@ class RecipeAPITestCase(TestCase):
         }, response.json()['results'][0]
         )
 
+    def test_recipe_list_queries_do_not_depend_on_page_size(self):
+        ingredient_2 = Ingredient.objects.create(
+            name="Морковь",
+            measurement_unit="кг",
+        )
+        for number in range(2, 12):
+            recipe = Recipe.objects.create(
+                author=self.user_3 if number % 2 else self.user_2,
+                name=f"Блюда№{number}",
+                image=None,
+                text='текст блюда',
+                cooking_time=number
+            )
+            recipe.tags.add(self.tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=number)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient_2, amount=1)
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client_2.get('/api/recipes/?limit=2')
+        self.assertEqual(len(response.json()['results']), 2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.client_2.get('/api/recipes/?limit=11')
+        self.assertEqual(len(response.json()['results']), 11)
+        self.assertEqual(len(response.json()['results'][0]['ingredients']), 2)
+        self.assertEqual(len(small_page), len(large_page))
+
+    def test_recipe_list_count_is_cached(self):
+        cache.clear()
+        url = '/api/recipes/?tags=breakfast'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['count'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+
+        recipe = Recipe.objects.create(
+            author=self.user_2,
+            name="Блюда№2",
+            image=None,
+            text='текст блюда',
+            cooking_time=2
+        )
+        recipe.tags.add(self.tag)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_recipe_fragments_are_cached(self):
+        cache.clear()
+        url = f'/api/recipes/{self.recipe_1.id}/'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse(any(
+            'ingredients_ingredient' in query['sql']
+            or 'tags_tag' in query['sql'] for query in queries))
+        self.assertTrue(response.json()['is_favorited'])
+        self.assertFalse(self.client_1.get(url).json()['is_favorited'])
+
+        def recipe():
+            return self.client_1.get('/api/recipes/').json()['results'][0]
+
+        recipe()
+        self.tag.name = 'Поздний завтрак'
+        self.tag.save()
+        self.assertEqual(recipe()['tags'][0]['name'], 'Поздний завтрак')
+        self.ingredient.name = 'Капуста белокочанная'
+        self.ingredient.save()
+        self.assertEqual(
+            recipe()['ingredients'][0]['name'], 'Капуста белокочанная')
+        self.recipe_ingredient.amount = 5
+        self.recipe_ingredient.save()
+        self.assertEqual(recipe()['ingredients'][0]['amount'], 5)
+        self.user_2.first_name = 'Пётр'
+        self.user_2.save()
+        self.assertEqual(recipe()['author']['first_name'], 'Пётр')
+        self.recipe_1.tags.clear()
+        self.assertEqual(recipe()['tags'], [])
+        self.client_3.patch(
+            url,
+            {
+                'name': 'Новое название',
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 7}],
+            },
+            format='json'
+        )
+        self.assertEqual(recipe()['name'], 'Новое название')
+        self.assertEqual(recipe()['tags'][0]['id'], self.tag.id)
+        self.assertEqual(recipe()['ingredients'][0]['amount'], 7)
+
+    def test_stale_recipe_fragment_is_ignored(self):
+        cache.clear()
+        url = f'/api/recipes/{self.recipe_1.id}/'
+        self.client.get(url)
+        key = recipe_fragment_key(self.recipe_1.id)
+        stale = cache.get(key)
+        self.recipe_1.name = 'Новое название'
+        self.recipe_1.save()
+        # Запрос, прочитавший рецепт до изменения, сохранил фрагмент позже.
+        cache.set(key, stale)
+        self.assertEqual(self.client.get(url).json()['name'],
+                         'Новое название')
+
+    def test_recipe_list_page_is_shared(self):
+        cache.clear()
+        url = '/api/recipes/?tags=breakfast'
+        self.client_1.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(response.json()['results'][0]['is_favorited'])
+        self.assertFalse(
+            self.client_1.get(url).json()['results'][0]['is_favorited'])
+
+        self.client_1.post(f'/api/recipes/{self.recipe_1.id}/favorite/')
+        self.assertTrue(
+            self.client_1.get(url).json()['results'][0]['is_favorited'])
+        self.assertEqual(
+            self.client_3.get('/api/recipes/?is_favorited=1').json()['count'],
+            0
+        )
+        self.assertEqual(
+            self.client.get('/api/recipes/?is_favorited=1').json()['count'],
+            1
+        )
+
+    def test_recipe_list_cursor_pagination(self):
+        for number in range(2, 16):
+            recipe = Recipe.objects.create(
+                author=self.user_2,
+                name=f"Блюда№{number}",
+                image=None,
+                text='текст блюда',
+                cooking_time=number
+            )
+            if number % 2:
+                recipe.tags.add(self.tag)
+        expected = list(
+            Recipe.objects.filter(tags=self.tag).values_list('id', flat=True))
+
+        ids = []
+        url = '/api/recipes/?pagination=cursor&limit=3&tags=breakfast'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotIn('count', response.json())
+            self.assertFalse(
+                any('COUNT(' in query['sql'] for query in queries))
+            ids += [recipe['id'] for recipe in response.json()['results']]
+            last_page = response.json()
+            url = last_page['next']
+        self.assertEqual(ids, expected)
+
+        response = self.client.get(last_page['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            expected[3:6]
+        )
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_recipe_search(self):
+        soup = Recipe.objects.create(
+            author=self.user_2,
+            name="Борщ",
+            image=None,
+            text='Суп со свёклой',
+            cooking_time=60
+        )
+        RecipeIngredient.objects.create(
+            recipe=soup, ingredient=self.ingredient, amount=1)
+
+        def search(query):
+            response = self.client.get('/api/recipes/', {'search': query})
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            return [recipe['id'] for recipe in response.json()['results']]
+
+        self.assertEqual(search('Борщ'), [soup.id])
+        self.assertEqual(search('свёклой'), [soup.id])
+        self.assertEqual(search('Капуста'), [soup.id, self.recipe_1.id])
+        self.assertEqual(search('Капуста Борщ'), [soup.id])
+        self.assertEqual(search('плов'), [])
+
+        response = self.client.get(
+            '/api/recipes/', {'search': 'Капуста', 'pagination': 'cursor'})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            search('Капуста'))
+
+    def test_search_vector_is_not_loaded(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/recipes/')
+            self.client.get(f'/api/recipes/{self.recipe_1.id}/')
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'search_vector' in query['sql']
+        ])
+
     def test_recipe_by_id(self):
         response = self.client.get('/api/recipes/1/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
@@ -216,7 +443,44 @@ class RecipeAPITestCase(TestCase):
         }
         response_4 = self.client.post('/api/recipes/',
                                       payload_not_found, format="json")
-        self.assertEqual(response_4.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(response_4.status_code, HTTPStatus.BAD_REQUEST)
+
+        payload_not_found['ingredients'] = [
+            {"id": 1, "amount": 2},
+            {"id": 3, "amount": 2},
+            {"id": 4, "amount": 2},
+        ]
+        recipes_count = Recipe.objects.count()
+        response_5 = self.client.post('/api/recipes/',
+                                      payload_not_found, format="json")
+        self.assertEqual(response_5.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(
+            response_5.json()['ingredients']['error'],
+            'Ингредиенты не найдены: 3, 4.')
+        self.assertEqual(Recipe.objects.count(), recipes_count)
+
+    def test_create_recipe_queries(self):
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(20)
+        ]
+        payload = {
+            "ingredients": [
+                {"id": ingredient.id, "amount": 2}
+                for ingredient in ingredients
+            ],
+            "tags": [self.tag.id],
+            "name": "Блюда№3",
+            "text": "текст блюда",
+            "cooking_time": 2
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/recipes/', payload, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(response.json()['ingredients']), 20)
+        self.assertLess(len(queries), 20)
 
     def test_update_recipe(self):
         payload = {
@@ -264,6 +528,62 @@ class RecipeAPITestCase(TestCase):
                                          payload_update, format="json")
         self.assertEqual(response_5.status_code, HTTPStatus.FORBIDDEN)
 
+    def test_update_recipe_changes_only_edited_rows(self):
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(10)
+        ]
+        for ingredient in ingredients:
+            RecipeIngredient.objects.create(
+                recipe=self.recipe_1, ingredient=ingredient, amount=1)
+        payload = {
+            "ingredients": [
+                {"id": ingredient.id, "amount": 1}
+                for ingredient in ingredients[1:]
+            ] + [{"id": self.ingredient.id, "amount": 5}],
+        }
+        kept = dict(
+            RecipeIngredient.objects.filter(
+                recipe=self.recipe_1,
+                ingredient__in=ingredients[1:]
+            ).values_list('ingredient_id', 'pk')
+        )
+        payload["ingredients"][0]["amount"] = 7
+
+        response = self.client_3.patch(
+            f'/api/recipes/{self.recipe_1.id}/', payload, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        amounts = {
+            item['id']: item['amount']
+            for item in response.json()['ingredients']
+        }
+        self.assertEqual(len(amounts), 10)
+        self.assertEqual(amounts[ingredients[1].id], 7)
+        self.assertEqual(amounts[self.ingredient.id], 5)
+        self.assertNotIn(ingredients[0].id, amounts)
+        self.assertEqual(
+            dict(
+                RecipeIngredient.objects.filter(
+                    recipe=self.recipe_1,
+                    ingredient__in=ingredients[1:]
+                ).values_list('ingredient_id', 'pk')
+            ),
+            kept
+        )
+
+    def test_update_recipe_keeps_viewer_flags(self):
+        Favorite.objects.create(user=self.user_2, recipe=self.recipe_1)
+        ShoppingCart.objects.create(user=self.user_2, recipe=self.recipe_1)
+
+        response = self.client_3.patch(
+            f'/api/recipes/{self.recipe_1.id}/',
+            {"name": "Блюда№1, новое"}, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['name'], "Блюда№1, новое")
+        self.assertTrue(response.json()['is_favorited'])
+        self.assertTrue(response.json()['is_in_shopping_cart'])
+
     def test_delete_recipe(self):
         response_1 = self.client.delete('/api/recipes/1/', format="json")
         self.assertEqual(response_1.status_code, HTTPStatus.FORBIDDEN)
@@ -294,6 +614,8 @@ class ShoppingCartFavoriteAPITestCase(TestCase):
         self.client = APIClient()
         self.client_2 = APIClient()
         self.client.force_authenticate(user=self.user_1)
+        for cache in caches.all():
+            cache.clear()
 
     def test_download_shopping_cart(self):
         url = '/api/recipes/download_shopping_cart/'
@@ -301,6 +623,94 @@ class ShoppingCartFavoriteAPITestCase(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.OK)
         response_2 = self.client_2.get(url)
         self.assertEqual(response_2.status_code, HTTPStatus.UNAUTHORIZED)
+        self.assertEqual(response_2['Content-Type'], 'application/json')
+        response_2 = self.client_2.get(url, {'format': 'pdf'})
+        self.assertEqual(response_2['Content-Type'], 'application/json')
+
+    def test_download_shopping_cart_is_cached(self):
+        url = '/api/recipes/download_shopping_cart/'
+        ingredient = Ingredient.objects.create(
+            name="Капуста", measurement_unit="кг")
+        recipe_ingredient = RecipeIngredient.objects.create(
+            recipe=self.recipe_1, ingredient=ingredient, amount=2)
+        self.client.post('/api/recipes/1/shopping_cart/')
+
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        recipe_ingredient.amount = 3
+        recipe_ingredient.save()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.client.delete('/api/recipes/1/shopping_cart/')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(
+            get_shopping_list_cache_stats(), {'hits': 2, 'misses': 3})
+
+    def test_download_shopping_cart_formats(self):
+        url = '/api/recipes/download_shopping_cart/'
+        ingredient = Ingredient.objects.create(
+            name="Капуста", measurement_unit="кг")
+        RecipeIngredient.objects.create(
+            recipe=self.recipe_1, ingredient=ingredient, amount=2)
+        ShoppingCart.objects.create(user=self.user_1, recipe=self.recipe_1)
+
+        response = self.client.get(url, {'format': 'txt'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Список покупок пользователя vasya.pupkin: \n'
+            'Капуста (кг) - 2\n'
+        )
+
+        response = self.client.get(url, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Ингредиент,Единица измерения,Количество\r\n'
+            'Капуста,кг,2\r\n'
+        )
+
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        response = self.client.get(url, {'format': 'json'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        response = self.client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_shopping_list_is_aggregated(self):
+        recipe_2 = Recipe.objects.create(
+            author=self.user_1,
+            name="Блюда№2",
+            image=None,
+            text='текст блюда',
+            cooking_time=3
+        )
+        cabbage = Ingredient.objects.create(
+            name="Капуста", measurement_unit="кг")
+        salt = Ingredient.objects.create(
+            name="Соль", measurement_unit="г")
+        RecipeIngredient.objects.create(
+            recipe=self.recipe_1, ingredient=cabbage, amount=2)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe_1, ingredient=salt, amount=5)
+        RecipeIngredient.objects.create(
+            recipe=recipe_2, ingredient=cabbage, amount=3)
+        ShoppingCart.objects.create(user=self.user_1, recipe=self.recipe_1)
+        ShoppingCart.objects.create(user=self.user_1, recipe=recipe_2)
+
+        with self.assertNumQueries(1):
+            shopping_list = list(get_shopping_list(self.user_1))
+        self.assertEqual(shopping_list, [
+            {'name': 'Капуста', 'measurement_unit': 'кг', 'total_amount': 5},
+            {'name': 'Соль', 'measurement_unit': 'г', 'total_amount': 5},
+        ])
 
     def test_add_shopping_cart(self):
         url = '/api/recipes/1/shopping_cart/'
@@ -372,3 +782,699 @@ class ShoppingCartFavoriteAPITestCase(TestCase):
         self.assertEqual(response_2.status_code, HTTPStatus.NO_CONTENT)
         response_2 = self.client.delete(url, data, format="json")
         self.assertEqual(response_2.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_bulk_shopping_cart_and_favorite(self):
+        recipes = [self.recipe_1] + [
+            Recipe.objects.create(
+                author=self.user_1,
+                name=f"Блюда№{number}",
+                image=None,
+                text='текст блюда',
+                cooking_time=2
+            )
+            for number in range(2, 12)
+        ]
+        ids = [recipe.id for recipe in recipes]
+        missing_id = ids[-1] + 100
+        self.client.post(f'/api/recipes/{ids[0]}/shopping_cart/')
+
+        for url, model in (('/api/recipes/shopping_cart/', ShoppingCart),
+                           ('/api/recipes/favorite/', Favorite)):
+            with CaptureQueriesContext(connection) as small_batch:
+                self.client.post(url, {'recipes': ids[:2]}, format='json')
+            with CaptureQueriesContext(connection) as large_batch:
+                response = self.client.post(
+                    url, {'recipes': ids + [missing_id]}, format='json')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(len(small_batch), len(large_batch))
+            statuses = {
+                item['id']: item['status']
+                for item in response.json()['results']
+            }
+            self.assertEqual(statuses[ids[0]], 'already_added')
+            self.assertEqual(statuses[ids[5]], 'added')
+            self.assertEqual(statuses[missing_id], 'not_found')
+            self.assertEqual(
+                model.objects.filter(user=self.user_1).count(), len(ids))
+
+            response = self.client.delete(
+                url, {'recipes': ids[:3] + [missing_id]}, format='json')
+            self.assertEqual(
+                [item['status'] for item in response.json()['results']],
+                ['removed', 'removed', 'removed', 'not_found']
+            )
+            response = self.client.delete(
+                url, {'recipes': ids[:1]}, format='json')
+            self.assertEqual(
+                response.json()['results'],
+                [{'id': ids[0], 'status': 'already_removed'}]
+            )
+
+        self.assertEqual(find_counter_mismatches(), [])
+        url = '/api/recipes/download_shopping_cart/'
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.client.post(
+            '/api/recipes/shopping_cart/', {'recipes': ids}, format='json')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(
+            self.client.post(
+                '/api/recipes/favorite/', {'recipes': []}, format='json'
+            ).status_code,
+            HTTPStatus.BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client_2.post(
+                '/api/recipes/favorite/', {'recipes': ids}, format='json'
+            ).status_code,
+            HTTPStatus.UNAUTHORIZED
+        )
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email="author@yandex.ru",
+            username="author",
+            first_name="Автор",
+            last_name="Рецептов",
+            password="12331214ssad"
+        )
+        self.user = User.objects.create_user(
+            email="reader@yandex.ru",
+            username="reader",
+            first_name="Читатель",
+            last_name="Рецептов",
+            password="12331214ssad"
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="Блюда№1",
+            image=None,
+            text='текст блюда',
+            cooking_time=2
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def assertCounters(self, obj, **counters):
+        obj.refresh_from_db()
+        for field, value in counters.items():
+            self.assertEqual(getattr(obj, field), value, field)
+
+    def test_counters_follow_api_changes(self):
+        self.assertCounters(self.author, recipes_count=1)
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.post(url + 'favorite/')
+        self.client.post(url + 'shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(
+            self.recipe, favorites_count=1, shopping_cart_count=1)
+        self.assertCounters(self.author, followers_count=1)
+        self.assertCounters(self.user, following_count=1)
+
+        self.client.delete(url + 'favorite/')
+        self.client.delete(url + 'shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(
+            self.recipe, favorites_count=0, shopping_cart_count=0)
+        self.assertCounters(self.author, followers_count=0)
+        self.assertCounters(self.user, following_count=0)
+
+        self.recipe.delete()
+        self.assertCounters(self.author, recipes_count=0)
+        self.assertEqual(find_counter_mismatches(), [])
+
+    def test_rebuild_counters(self):
+        Favorite.objects.bulk_create([
+            Favorite(user=self.user, recipe=self.recipe),
+            Favorite(user=self.author, recipe=self.recipe),
+        ])
+        self.assertEqual(
+            find_counter_mismatches(),
+            [('foodgram.Recipe', 'favorites_count', self.recipe.id, 0, 2)]
+        )
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', check=True, stdout=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCounters(self.recipe, favorites_count=2)
+        call_command('rebuild_counters', check=True, stdout=StringIO())
+
+    def test_relation_service(self):
+        for model, fields in (
+            (Favorite, {'user': self.user, 'recipe': self.recipe}),
+            (ShoppingCart, {'user': self.user, 'recipe': self.recipe}),
+            (Follow, {'user': self.user, 'author': self.author}),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(add_relation(model, **fields))
+            self.assertFalse(add_relation(model, **fields))
+            self.assertEqual(model.objects.filter(**fields).count(), 1)
+            self.assertTrue(remove_relation(model, **fields))
+            self.assertFalse(remove_relation(model, **fields))
+            self.assertFalse(model.objects.filter(**fields).exists())
+            self.assertTrue(
+                queries.captured_queries[0]['sql'].startswith('INSERT'))
+        self.assertEqual(find_counter_mismatches(), [])
+
+    def test_benchmark_relations(self):
+        favorite = Favorite.objects.create(
+            user=self.author, recipe=self.recipe)
+        for path in ('service', 'orm'):
+            out = StringIO()
+            call_command(
+                'benchmark_relations', threads=1, iterations=5,
+                path=path, stdout=out)
+            self.assertIn('Ошибок из-за гонок: 0', out.getvalue())
+        self.assertTrue(Favorite.objects.filter(pk=favorite.pk).exists())
+        self.assertEqual(
+            set(User.objects.all()), {self.author, self.user})
+        self.assertEqual(list(Recipe.objects.all()), [self.recipe])
+        self.assertCounters(self.recipe, favorites_count=1)
+
+
+class FeedAPITestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f"user{number}@yandex.ru",
+                username=f"user{number}",
+                first_name="Имя",
+                last_name=f"Фамилия{number}",
+                password="12331214ssad"
+            )
+            for number in range(4)
+        ]
+        self.reader, self.author, self.celebrity, self.fan = self.users
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def publish(self, author, count):
+        return [
+            Recipe.objects.create(
+                author=author,
+                name=f"Блюдо {author.username} {number}",
+                image=None,
+                text='текст блюда',
+                cooking_time=2
+            )
+            for number in range(count)
+        ]
+
+    def read_feed(self, limit=2):
+        ids = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            ids.extend(recipe['id'] for recipe in response.json()['results'])
+            url = response.json()['next']
+        return ids
+
+    @override_settings(FEED_FAN_OUT_MAX_FOLLOWERS=1)
+    def test_feed(self):
+        old = self.publish(self.author, 2)
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 2)
+
+        Follow.objects.create(user=self.fan, author=self.celebrity)
+        self.client.post(f'/api/users/{self.celebrity.id}/subscribe/')
+        celebrity_recipes = self.publish(self.celebrity, 2)
+        new = self.publish(self.author, 1)
+        self.publish(self.fan, 1)
+        self.assertFalse(
+            FeedEntry.objects.filter(author=self.celebrity).exists())
+
+        expected = sorted(
+            old + celebrity_recipes + new,
+            key=lambda recipe: (recipe.pub_date, recipe.id),
+            reverse=True
+        )
+        self.assertEqual(
+            self.read_feed(), [recipe.id for recipe in expected])
+
+        response = self.client.get('/api/recipes/feed/?limit=2')
+        next_page = self.client.get(response.json()['next'])
+        previous_page = self.client.get(next_page.json()['previous'])
+        self.assertEqual(previous_page.json()['results'],
+                         response.json()['results'])
+
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(
+            self.read_feed(),
+            [recipe.id for recipe in reversed(celebrity_recipes)]
+        )
+        self.assertEqual(
+            APIClient().get('/api/recipes/feed/').status_code,
+            HTTPStatus.UNAUTHORIZED
+        )
+
+    @override_settings(
+        FEED_FAN_OUT_MAX_FOLLOWERS=1, FEED_BACKFILL_ASYNC=False)
+    def test_feed_after_author_drops_below_threshold(self):
+        Follow.objects.create(user=self.fan, author=self.celebrity)
+        self.client.post(f'/api/users/{self.celebrity.id}/subscribe/')
+        recipes = self.publish(self.celebrity, 2)
+        self.assertFalse(FeedEntry.objects.exists())
+
+        fan = APIClient()
+        fan.force_authenticate(user=self.fan)
+        with self.captureOnCommitCallbacks() as callbacks:
+            fan.delete(f'/api/users/{self.celebrity.id}/subscribe/')
+        self.assertFalse(FeedEntry.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.reader).values_list('recipe_id', flat=True)),
+            {recipe.id for recipe in recipes}
+        )
+        self.assertEqual(
+            self.read_feed(), [recipe.id for recipe in reversed(recipes)])
+
+    def test_feed_entries_are_deleted_without_loading(self):
+        recipe, = self.publish(self.author, 1)
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertTrue(FeedEntry.objects.filter(recipe=recipe).exists())
+
+        table = FeedEntry._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            recipe.delete()
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and table in query['sql']
+        ])
+        self.assertFalse(FeedEntry.objects.exists())
+
+
+def make_image_base64(size=(2000, 1500)):
+    buffer = BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class MediaTestCase(TestCase):
+    """
+    Файлы пишутся во временный MEDIA_ROOT, который удаляется после
+    теста, копии изображений строятся сразу после коммита.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name, RECIPE_THUMBNAILS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ThumbnailsTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email="vpupkin@yandex.ru",
+            username="vasya.pupkin",
+            first_name="Вася",
+            last_name="Пупкин",
+            password="12331214ssad"
+        )
+        self.ingredient = Ingredient.objects.create(
+            name="Капуста", measurement_unit="кг")
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_thumbnails_are_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/',
+                {
+                    'ingredients': [{'id': self.ingredient.id, 'amount': 2}],
+                    'tags': [self.tag.id],
+                    'image': make_image_base64(),
+                    'name': 'Блюдо с фото',
+                    'text': 'текст блюда',
+                    'cooking_time': 2,
+                },
+                format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.json()['image_card'],
+                         response.json()['image'])
+
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(
+            recipe.image_thumbnails['source'], recipe.image.name)
+        for size, (width, height) in {
+            'card': (400, 300), 'detail': (800, 600),
+            'retina': (1600, 1200)
+        }.items():
+            with default_storage.open(
+                    recipe.image_thumbnails[size]) as file:
+                image = Image.open(file)
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (width, height))
+
+        data = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertTrue(data['image_card'].startswith('http://testserver/'))
+        self.assertTrue(data['image_retina'].endswith('_retina.webp'))
+        favorite = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertTrue(favorite.json()['image_card'].endswith('_card.webp'))
+
+    def test_generate_thumbnails_command(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name="Блюдо с фото",
+                image=ContentFile(
+                    base64.b64decode(make_image_base64((100, 80)).split(
+                        ',')[1]),
+                    name='photo.png'
+                ),
+                text='текст блюда',
+                cooking_time=2
+            )
+        self.assertEqual(recipe.image_thumbnails, {})
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Построены копии для 1 рецептов', out.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(set(recipe.image_thumbnails),
+                         {'source', 'card', 'detail', 'retina'})
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Построены копии для 0 рецептов', out.getvalue())
+
+
+def make_image_file(size=(2000, 1500), name='photo.png',
+                    content_type='image/png'):
+    buffer = BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type)
+
+
+class ImageUploadTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email="vpupkin@yandex.ru",
+            username="vasya.pupkin",
+            first_name="Вася",
+            last_name="Пупкин",
+            password="12331214ssad"
+        )
+        self.other_user = User.objects.create_user(
+            email="test@yandex.ru",
+            username="test",
+            first_name="Тест",
+            last_name="Тестов",
+            password="12331214ssad"
+        )
+        self.ingredient = Ingredient.objects.create(
+            name="Капуста", measurement_unit="кг")
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, image):
+        return self.client.post(
+            '/api/recipes/images/', {'image': image}, format='multipart')
+
+    def recipe_data(self, **image):
+        return {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 2}],
+            'tags': [self.tag.id],
+            'name': 'Блюдо с фото',
+            'text': 'текст блюда',
+            'cooking_time': 2,
+            **image
+        }
+
+    def test_create_recipe_with_uploaded_image(self):
+        image = make_image_file()
+        digest = hashlib.sha256(image.read()).hexdigest()
+        image.seek(0)
+        response = self.upload(image)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        token = response.json()['token']
+        upload = ImageUpload.objects.get(token=token)
+        self.assertEqual(upload.user, self.user)
+        self.assertEqual(upload.image.name,
+                         f'recipes/{digest[:2]}/{digest[2:4]}/{digest}.png')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.recipe_data(image_token=token),
+                format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(recipe.image.name, upload.image.name)
+        self.assertTrue(default_storage.exists(recipe.image.name))
+        self.assertEqual(recipe.image_thumbnails['source'], recipe.image.name)
+        self.assertFalse(ImageUpload.objects.exists())
+
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/', {'image_token': token},
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+        token = self.upload(make_image_file((10, 10))).json()['token']
+        image_name = ImageUpload.objects.get(token=token).image.name
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.recipe_data(image_token=token), format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, image_name)
+
+    def test_base64_image_still_works(self):
+        response = self.client.post(
+            '/api/recipes/', self.recipe_data(image=make_image_base64()),
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        response = self.client.post(
+            '/api/recipes/',
+            self.recipe_data(
+                image=make_image_base64(),
+                image_token=self.upload(make_image_file()).json()['token']
+            ),
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_other_user_token_is_rejected(self):
+        token = self.upload(make_image_file()).json()['token']
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.post(
+            '/api/recipes/', self.recipe_data(image_token=token),
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertTrue(ImageUpload.objects.filter(token=token).exists())
+
+    def test_wrong_type_is_rejected(self):
+        response = self.upload(SimpleUploadedFile(
+            'photo.png', b'not an image' * 100, 'image/png'))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('error', response.json())
+        response = self.upload(SimpleUploadedFile(
+            'notes.txt', b'text', 'text/plain'))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.upload(SimpleUploadedFile(
+            'photo.png', make_image_file().read()[:300], 'image/png'))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_too_large_image_is_rejected(self):
+        image = make_image_file((2000, 2000))
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=image.size - 1,
+                               IMAGE_UPLOAD_CHUNK_SIZE=1024):
+            response = self.upload(image)
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=1024,
+                               IMAGE_UPLOAD_CHUNK_SIZE=1024):
+            response = self.upload(make_image_file())
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        with override_settings(IMAGE_UPLOAD_MAX_PIXELS=100):
+            response = self.upload(make_image_file())
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+
+
+def make_stale(name):
+    path = default_storage.path(name)
+    os.utime(path, (0, 0))
+    return path
+
+
+class ImageStorageTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email="vpupkin@yandex.ru",
+            username="vasya.pupkin",
+            first_name="Вася",
+            last_name="Пупкин",
+            password="12331214ssad"
+        )
+
+    def create_recipe(self, size=(100, 80), name='photo.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name="Блюдо с фото",
+                image=ContentFile(
+                    base64.b64decode(make_image_base64(size).split(',')[1]),
+                    name=name
+                ),
+                text='текст блюда',
+                cooking_time=2
+            )
+        return Recipe.objects.get(pk=recipe.pk)
+
+    def test_identical_images_are_stored_once(self):
+        first = self.create_recipe(name='first.PNG')
+        second = self.create_recipe(name='second.png')
+        self.assertEqual(first.image.name, second.image.name)
+        with default_storage.open(first.image.name) as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        self.assertEqual(
+            first.image.name,
+            f'recipes/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(
+            os.listdir(os.path.dirname(default_storage.path(
+                first.image.name))),
+            [f'{digest}.png'])
+        self.assertEqual(first.image_thumbnails, second.image_thumbnails)
+        self.assertEqual(set(first.image_thumbnails),
+                         {'source', 'card', 'detail', 'retina'})
+        self.assertNotEqual(
+            self.create_recipe((90, 80)).image.name, first.image.name)
+
+    def test_replaced_and_deleted_images_are_released(self):
+        first = self.create_recipe()
+        second = self.create_recipe()
+        shared = first.image.name
+        thumbnail = first.image_thumbnails['card']
+        make_stale(shared)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = ContentFile(
+                base64.b64decode(
+                    make_image_base64((90, 80)).split(',')[1]),
+                name='new.png'
+            )
+            first.save()
+        self.assertTrue(default_storage.exists(shared))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(shared))
+        self.assertFalse(default_storage.exists(thumbnail))
+
+        make_stale(first.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=first.pk).delete()
+        self.assertFalse(default_storage.exists(first.image.name))
+
+    def test_fresh_image_is_kept_until_collected(self):
+        recipe = self.create_recipe()
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertTrue(default_storage.exists(name))
+        make_stale(name)
+        call_command('collect_images', stdout=StringIO())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_collect_images(self):
+        recipe = self.create_recipe()
+        for path in [recipe.image.name] + [
+                path for key, path in recipe.image_thumbnails.items()
+                if key != 'source']:
+            make_stale(path)
+        orphan = default_storage.save(
+            'recipes/old/orphan.png', ContentFile(b'orphan'))
+        orphan_thumbnail = default_storage.save(
+            'thumbnails/recipes/old/orphan_card.webp', ContentFile(b'old'))
+        fresh = default_storage.save(
+            'recipes/fresh.png', ContentFile(b'fresh'))
+        make_stale(orphan)
+        make_stale(orphan_thumbnail)
+        upload = ImageUpload.objects.create(
+            user=self.user,
+            image=ContentFile(b'upload', name='upload.png'))
+        stale_upload = ImageUpload.objects.create(
+            user=self.user,
+            image=ContentFile(b'stale upload', name='upload.png'))
+        ImageUpload.objects.filter(pk=stale_upload.pk).update(
+            created=timezone.now() - timedelta(days=2))
+        make_stale(upload.image.name)
+        make_stale(stale_upload.image.name)
+
+        out = StringIO()
+        call_command('collect_images', dry_run=True, stdout=out)
+        self.assertIn(
+            'Будет удалено устаревших загрузок: 1, файлов: 3',
+            out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertTrue(ImageUpload.objects.filter(
+            pk=stale_upload.pk).exists())
+
+        call_command('collect_images', stdout=out)
+        self.assertIn(
+            'Удалено устаревших загрузок: 1, файлов: 3', out.getvalue())
+        for name in (orphan, orphan_thumbnail, stale_upload.image.name):
+            self.assertFalse(default_storage.exists(name))
+        self.assertFalse(ImageUpload.objects.filter(
+            pk=stale_upload.pk).exists())
+        for name in [fresh, upload.image.name, recipe.image.name,
+                     *recipe.image_thumbnails.values()]:
+            self.assertTrue(default_storage.exists(name))
+
+
+class GenerateLoadDataTestCase(TestCase):
+    def setUp(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+            for number in range(20)
+        )
+
+    def generate(self):
+        call_command(
+            'generate_load_data', users=20, recipes=50, follows=40,
+            favorites=80, shopping_carts=30, ingredients_per_recipe=5,
+            batch_size=7, stdout=StringIO()
+        )
+        return (
+            list(Recipe.objects.order_by('id').values_list(
+                'author__username', 'cooking_time')),
+            list(Favorite.objects.order_by('id').values_list(
+                'user__last_name', 'recipe__cooking_time')),
+        )
+
+    def test_generate_load_data(self):
+        first_run = self.generate()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertEqual(RecipeIngredient.objects.count(), 250)
+        self.assertEqual(Favorite.objects.count(), 80)
+        self.assertEqual(ShoppingCart.objects.count(), 30)
+        self.assertTrue(0 < Follow.objects.count() <= 40)
+        self.assertEqual(find_counter_mismatches(), [])
+        follow = Follow.objects.filter(author__recipes_count__gt=0).first()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=follow.user, author=follow.author).exists())
+
+        for model in (FeedEntry, Favorite, ShoppingCart, Follow,
+                      RecipeIngredient, Recipe, User):
+            model.objects.all().delete()
+        second_run = self.generate()
+        self.assertEqual(
+            [row[1:] for row in first_run[0]],
+            [row[1:] for row in second_run[0]],
+        )
+        self.assertEqual(len(first_run[1]), len(second_run[1]))
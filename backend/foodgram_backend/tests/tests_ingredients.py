@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
 
 from rest_framework.test import APIClient
@@ -29,6 +30,7 @@ class IngredientAPITestCase(TestCase):
         )
         self.client = APIClient()
         self.client.force_authenticate(user=self.user_1)
+        cache.clear()
 
     def test_get_ingredients_list(self):
         response = self.client.get('/api/ingredients/')
@@ -52,3 +54,76 @@ class IngredientAPITestCase(TestCase):
         }
         self.assertEqual(response.data, expectation)
         self.assertEqual(response_2.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_autocomplete_from_index(self):
+        Ingredient.objects.create(name="капуста квашеная",
+                                  measurement_unit="г")
+        self.client.get('/api/ingredients/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=Кап')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [item['name'] for item in response.json()], ["Капуста"])
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?search=кап')
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ["Капуста", "капуста квашеная"]
+        )
+        response = self.client.get('/api/ingredients/?search=кап,кв')
+        self.assertEqual(response.json(), [])
+
+        Ingredient.objects.create(name="Капуста брокколи",
+                                  measurement_unit="г")
+        response = self.client.get('/api/ingredients/?name=Капуста')
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ["Капуста", "Капуста брокколи"]
+        )
+        self.ingredient.delete()
+        response = self.client.get('/api/ingredients/?name=Кап')
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ["Капуста брокколи"]
+        )
+
+    def test_ingredients_conditional_get(self):
+        for path in ('/api/ingredients/', '/api/ingredients/?name=Кап'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            etag = response['ETag']
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Last-Modified', response)
+
+            with self.assertNumQueries(0):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+        Ingredient.objects.create(name="Капуста брокколи",
+                                  measurement_unit="г")
+        response = self.client.get(
+            '/api/ingredients/?name=Кап', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_fuzzy_search(self):
+        for name in ("молоко", "молоко сгущенное", "миндальное молоко",
+                     "сахар", "сахар ванильный", "соль"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+        def search(name):
+            response = self.client.get(
+                '/api/ingredients/', {'name': name, 'fuzzy': 1})
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            return [item['name'] for item in response.json()]
+
+        self.assertEqual(
+            search('малако'),
+            ["молоко", "молоко сгущенное", "миндальное молоко"]
+        )
+        self.assertEqual(search('сахр')[:2], ["сахар", "сахар ванильный"])
+        self.assertEqual(
+            search('молоко')[:2], ["молоко", "молоко сгущенное"])
+        self.assertEqual(search('картофель'), ["Картошка"])
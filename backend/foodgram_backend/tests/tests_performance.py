@@ -0,0 +1,234 @@
+import json
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from api.ingredients.ingredients_index import ingredient_index
+from apps.foodgram.counters import rebuild_counters
+from apps.foodgram.models import (Favorite, FeedEntry, Recipe,
+                                  RecipeIngredient, RecipeTags, ShoppingCart)
+from apps.ingredients.models import Ingredient
+from apps.tags.models import Tag
+from apps.users.models import Follow
+
+User = get_user_model()
+
+USERS_COUNT = 60
+RECIPES_COUNT = 2000
+INGREDIENTS_COUNT = 300
+INGREDIENTS_PER_RECIPE = 12
+FOLLOWS_COUNT = 40
+FAVORITES_COUNT = 300
+SHOPPING_CART_COUNT = 20
+
+MAX_SECONDS = 1.5
+
+SEARCH_QUERIES = ('мол', 'малако', 'сахр', 'картофель', 'куриное филе',
+                  'помидр', 'лук', 'масло сливчное', 'петршка', 'яйц')
+MAX_FUZZY_SEARCH_SECONDS = 0.01
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Бюджет SQL-запросов и времени ответа для эндпоинтов API.
+    Данные заполняются в объёме, близком к боевому, чтобы N+1
+    проявлялся в количестве запросов, а не терялся на пустой базе.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create не отправляет сигналы, сбрасываем версии кэшей вручную.
+        cache.clear()
+        User.objects.bulk_create(
+            User(
+                email=f'user{number}@yandex.ru',
+                username=f'user{number}',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='12314ssad',
+            ) for number in range(USERS_COUNT)
+        )
+        cls.users = list(User.objects.order_by('id'))
+        cls.user = cls.users[0]
+        Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+                ('Ужин', '#8775D2', 'dinner'),
+            )
+        )
+        cls.tags = list(Tag.objects.order_by('id'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(INGREDIENTS_COUNT)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.users[number % USERS_COUNT],
+                name=f'Рецепт {number}',
+                text='текст рецепта',
+                cooking_time=number % 120 + 1,
+            ) for number in range(RECIPES_COUNT)
+        )
+        cls.recipes = list(Recipe.objects.order_by('id'))
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[
+                        (number + shift * 7) % INGREDIENTS_COUNT],
+                    amount=shift + 1,
+                )
+                for number, recipe in enumerate(cls.recipes)
+                for shift in range(INGREDIENTS_PER_RECIPE)
+            ),
+            batch_size=1000,
+        )
+        RecipeTags.objects.bulk_create(
+            (
+                RecipeTags(recipe=recipe, tag=cls.tags[number % 3])
+                for number, recipe in enumerate(cls.recipes)
+            ),
+            batch_size=1000,
+        )
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, author=author)
+            for author in cls.users[1:FOLLOWS_COUNT + 1]
+        )
+        Follow.objects.bulk_create(
+            Follow(user=follower, author=cls.user)
+            for follower in cls.users[1:]
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[:FAVORITES_COUNT]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[:SHOPPING_CART_COUNT]
+        )
+        rebuild_counters()
+        for author in cls.users[1:FOLLOWS_COUNT + 1]:
+            FeedEntry.objects.backfill(cls.user.id, author.id)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.anonymous_client = APIClient()
+
+    def assertBudget(self, url, max_queries, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f'{url}: {len(queries)} запросов (лимит {max_queries})'
+        )
+        self.assertLess(
+            elapsed, MAX_SECONDS,
+            f'{url}: {elapsed:.3f} c (лимит {MAX_SECONDS} c)'
+        )
+        return response
+
+    def test_recipe_list(self):
+        self.assertBudget('/api/recipes/', 5)
+        self.assertBudget('/api/recipes/?limit=50', 5)
+        self.assertBudget('/api/recipes/?limit=50', 4, self.anonymous_client)
+
+    def test_recipe_list_from_fragment_cache(self):
+        self.assertBudget('/api/recipes/?limit=50', 5)
+        self.assertBudget('/api/recipes/?limit=50', 1)
+        self.assertBudget('/api/recipes/?limit=50', 0, self.anonymous_client)
+        self.assertBudget(f'/api/recipes/{self.recipes[0].id}/', 2)
+
+    def test_recipe_list_filters(self):
+        self.assertBudget('/api/recipes/?tags=lunch&tags=dinner', 6)
+        self.assertBudget(
+            f'/api/recipes/?author={self.users[1].id}&limit=50', 5)
+        self.assertBudget('/api/recipes/?is_favorited=1&limit=50', 5)
+        self.assertBudget('/api/recipes/?is_in_shopping_cart=1', 5)
+
+    def test_recipe_detail(self):
+        self.assertBudget(f'/api/recipes/{self.recipes[0].id}/', 4)
+
+    def test_users_list(self):
+        self.assertBudget('/api/users/?limit=50', 3)
+
+    def test_subscriptions(self):
+        self.assertBudget('/api/users/subscriptions/?limit=6', 4)
+        self.assertBudget(
+            '/api/users/subscriptions/?limit=6&recipes_limit=3', 4)
+        self.assertBudget(
+            '/api/users/subscriptions/?limit=50&recipes_limit=3', 4)
+
+    def test_feed(self):
+        response = self.assertBudget('/api/recipes/feed/?limit=50', 6)
+        self.assertEqual(len(response.json()['results']), 50)
+        self.assertBudget(response.json()['next'], 6)
+
+    def test_ingredients(self):
+        self.assertBudget('/api/ingredients/', 1)
+        self.assertBudget('/api/ingredients/?name=ингредиент 1', 1)
+
+    def test_tags(self):
+        self.assertBudget('/api/tags/', 1)
+
+    def test_download_shopping_cart(self):
+        self.assertBudget('/api/recipes/download_shopping_cart/', 1)
+
+
+class IngredientSearchBenchmarkTestCase(TestCase):
+    """
+    Сравнение поиска с опечатками по индексу в памяти с прежним
+    фильтром name__startswith по базе на полном справочнике.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        with open(settings.BASE_DIR / 'data' / 'ingredients.json',
+                  encoding='utf8') as file:
+            Ingredient.objects.bulk_create(
+                Ingredient(**item) for item in json.load(file))
+
+    def measure(self, search):
+        started = time.perf_counter()
+        for query in SEARCH_QUERIES:
+            search(query)
+        return (time.perf_counter() - started) / len(SEARCH_QUERIES)
+
+    def test_fuzzy_search_speed(self):
+        ingredient_index.search()
+        fuzzy = self.measure(
+            lambda query: ingredient_index.fuzzy_search(
+                query,
+                limit=settings.INGREDIENT_FUZZY_SEARCH_LIMIT,
+                threshold=settings.INGREDIENT_FUZZY_SEARCH_THRESHOLD,
+            )
+        )
+        prefix = self.measure(
+            lambda query: list(Ingredient.objects.filter(
+                name__startswith=query).values('id', 'name')))
+        self.assertLess(
+            fuzzy, MAX_FUZZY_SEARCH_SECONDS,
+            f'поиск с опечатками {fuzzy * 1000:.2f} мс, '
+            f'префиксный фильтр {prefix * 1000:.2f} мс'
+        )
+        self.assertIn(
+            'молоко',
+            [item['name'] for item in ingredient_index.fuzzy_search(
+                'малако', limit=10, threshold=0.15)]
+        )
@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
 
 from rest_framework.test import APIClient
@@ -31,6 +32,7 @@ class TagAPITestCase(TestCase):
         )
         self.client = APIClient()
         self.client.force_authenticate(user=self.user_1)
+        cache.clear()
 
     def test_get_tags_list(self):
         response = self.client.get('/api/tags/')
@@ -56,3 +58,25 @@ class TagAPITestCase(TestCase):
         }
         self.assertEqual(response.data, expectation)
         self.assertEqual(response_2.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_tags_conditional_get(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(
+            '/api/tags/?format=json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 3)
@@ -1,7 +1,10 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APIClient
 
@@ -96,6 +99,31 @@ class UserAPITestCase(TestCase):
             }, response.json()['results'][0]
         )
 
+    def test_users_list_is_subscribed_in_one_query(self):
+        for number in range(10):
+            author = User.objects.create_user(
+                email=f"author{number}@yandex.ru",
+                username=f"author{number}",
+                first_name="Автор",
+                last_name="Авторов",
+                password="12314ssad"
+            )
+            if number % 2:
+                Follow.objects.create(user=self.user_1, author=author)
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get('/api/users/?limit=2')
+        self.assertEqual(len(response.json()['results']), 2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.client.get('/api/users/?limit=13')
+        results = response.json()['results']
+        self.assertEqual(len(results), 13)
+        self.assertEqual(
+            sum(user['is_subscribed'] for user in results), 5)
+        self.assertEqual(len(small_page), len(large_page))
+
     def test_get_user_by_me_id(self):
         response_1 = self.client.get('/api/users/me/')
         response_2 = self.client.get('/api/users/1/')
@@ -288,6 +316,8 @@ class FollowAPITestCase(TestCase):
                         "id": self.recipe_2.id,
                         "name": self.recipe_2.name,
                         "image": self.recipe_2.image,
+                        "image_card": None,
+                        "image_retina": None,
                         "cooking_time": self.recipe_2.cooking_time
                     }
                 ],
@@ -296,3 +326,46 @@ class FollowAPITestCase(TestCase):
         )
         response = self.client_2.get('/api/users/subscriptions/')
         self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_subscriptions_recipes_limit(self):
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        newer = [
+            Recipe.objects.create(
+                author=self.user_2,
+                name=f"Блюдо {number}",
+                image=None,
+                text='текст блюда',
+                cooking_time=number
+            )
+            for number in range(1, 4)
+        ]
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 2})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = {
+            author['id']: author for author in response.json()['results']}
+        self.assertEqual(
+            [recipe['id'] for recipe in results[self.user_2.id]['recipes']],
+            [newer[2].id, newer[1].id]
+        )
+        self.assertEqual(results[self.user_2.id]['recipes_count'], 4)
+        self.assertEqual(
+            [recipe['id'] for recipe in results[self.user_3.id]['recipes']],
+            [self.recipe_3.id]
+        )
+
+        new_author = User.objects.create_user(
+            email="new@yandex.ru",
+            username="newauthor",
+            first_name="Новый",
+            last_name="Автор",
+            password="12314ssad"
+        )
+        Follow.objects.create(user=self.user_1, author=new_author)
+        cache.clear()
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 2})
+        self.assertEqual(len(more_queries), len(queries))